@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+## Benchmarks
+
+# Micro benchmarks and scaling sweeps of the decision pipeline. Every benchmark times a single operation (an inference step or a tick
+# of a selection function) many times and reports latency percentiles in microseconds, together with the memory allocated by one call.
+# - infer_*: AiAgent.infer_states and infer_policies of a single factor, with cold and warm started message passing for deep policies
+# - tick_*: adapt_act_sel and par_act_sel ticks on the shipped scenarios (pick and place, point robot push/pull, battery)
+# - sweep_*: synthetic templates scaling the number of factors, the states per factor, the actions per factor and the depth of the
+#   precondition chain
+# The results are written as JSON with --output. With --baseline, the median latencies are compared with a previous JSON output and
+# the script exits with status 1 if a benchmark is slower than the baseline by more than --threshold.
+#
+# Usage: python benchmarks/run_benchmarks.py --output results.json [--baseline baseline.json] [--quick] [--filter sweep]
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from decision_making import ai_agent, state_action_templates_panda, state_act_point_robot, int_req_templates
+from decision_making.adaptive_action_selection import adapt_act_sel
+from decision_making.parallel_action_selection import par_act_sel
+from decision_making.workspace import measure_allocations
+
+
+class SyntheticFactor(object):
+    # Template of factor k with n_states states and n_actions actions: action 0 is idle, action a sets the state a-1 (modulo the states).
+    # The actions of factor k > 0 other than idle require state 0 of factor k-1 if chained, which builds a precondition chain
+    def __init__(self, k, n_states, n_actions, chained, prefix='f'):
+        self.state_name = '%s%d' % (prefix, k)
+        self.state_names = ['%s%d_s%d' % (prefix, k, s) for s in range(n_states)]
+        self.action_names = ['idle'] + ['%s%d_a%d' % (prefix, k, a) for a in range(1, n_actions)]
+        self.V = np.arange(n_actions)
+        self.B = np.zeros((n_states, n_states, n_actions))
+        self.B[:, :, 0] = np.eye(n_states)
+        for a in range(1, n_actions):
+            self.B[(a - 1) % n_states, :, a] = 1
+        requires = ['%s%d_s0' % (prefix, k - 1)] if chained and k > 0 else ['none']
+        self.preconditions = [['none']] + [requires]*(n_actions - 1)
+        self.A = np.eye(n_states)
+        self.C = np.zeros((n_states, 1))
+        self.D = np.ones((n_states, 1))/n_states
+        self.E = np.array([[1.01]] + [[1.]]*(n_actions - 1))
+        self.kappa_d = 1
+
+
+def synthetic_agents(n_factors, n_states, n_actions, chained=True, prefix='f'):
+    # Agents of a synthetic problem, the goal is state 0 of the last factor and every factor is observed in its last state
+    agents = [ai_agent.AiAgent(SyntheticFactor(k, n_states, n_actions, chained, prefix)) for k in range(n_factors)]
+    pref = np.zeros((n_states, 1))
+    pref[0] = 1
+    agents[-1].set_preferences(pref)
+    return agents, [n_states - 1]*n_factors
+
+
+def deep_agent(warm_start):
+    # Synthetic factor of 16 states with every policy of depth 3 over 4 actions, and several sweeps of message passing
+    mdp = SyntheticFactor(0, 16, 4, False)
+    mdp.V = np.array(list(itertools.product(range(4), repeat=3)))
+    return ai_agent.AiAgent(mdp, n_iterations=20, free_energy_tolerance=1e-4, warm_start=warm_start)
+
+
+def panda_agents():
+    agents = [ai_agent.AiAgent(m) for m in (state_action_templates_panda.MDPIsAtPlaceLoc(), state_action_templates_panda.MDPIsHolding(),
+                                            state_action_templates_panda.MDPIsReachable(), state_action_templates_panda.MDPIsPlacedOn())]
+    agents[3].set_preferences(np.array([[1.], [0.]]))
+    return agents, [1, 1, 0, 1]
+
+
+def point_robot_agents():
+    agents = [ai_agent.AiAgent(m) for m in (state_act_point_robot.MDPIsAt(), state_act_point_robot.MDPIsBlockAt(),
+                                            state_act_point_robot.MDPIsLocFree(), state_act_point_robot.MDPIsCloseTo())]
+    agents[1].set_preferences(np.array([[1.], [0.]]))
+    return agents, ['null', 1, 0, 1]
+
+
+def battery_agents():
+    agents = [ai_agent.AiAgent(int_req_templates.MDPBattery())]
+    agents[0].set_preferences(np.array([[2.], [0], [0]]))
+    return agents, [1]
+
+
+def measure(function, repeat, warmup):
+    # Latency percentiles in microseconds over repeat calls, and the memory allocated by one call
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            function()
+        samples = np.empty(repeat)
+        for r in range(repeat):
+            start = time.perf_counter()
+            function()
+            samples[r] = time.perf_counter() - start
+        allocations = measure_allocations(function)[1]
+    samples *= 1e6
+    return {'repeat': repeat, 'mean_us': float(np.mean(samples)), 'min_us': float(np.min(samples)),
+            'p50_us': float(np.percentile(samples, 50)), 'p90_us': float(np.percentile(samples, 90)),
+            'p99_us': float(np.percentile(samples, 99)), 'peak_bytes': allocations['peak_bytes']}
+
+
+def benchmarks(quick):
+    # (name, function) of every benchmark. The agents are built once per benchmark, ticks keep updating their beliefs
+    cases = []
+    agent = ai_agent.AiAgent(state_action_templates_panda.MDPIsHolding())
+    agent.infer_states(1)
+    cases.append(('infer_states_holding', lambda: agent.infer_states(1)))
+    cases.append(('infer_policies_holding', agent.infer_policies))
+    big, obs = synthetic_agents(1, 64, 8)
+    big[0].infer_states(obs[0])
+    cases.append(('infer_states_64_states', lambda: big[0].infer_states(obs[0])))
+    cases.append(('infer_policies_64_states', big[0].infer_policies))
+    for warm_start in (False, True):
+        deep = deep_agent(warm_start)
+        cases.append(('infer_states_deep_%s' % ('warm' if warm_start else 'cold'), lambda deep=deep: deep.infer_states(15)))
+
+    for name, build, selector in (('tick_adapt_panda', panda_agents, adapt_act_sel), ('tick_par_panda', panda_agents, par_act_sel),
+                                  ('tick_adapt_point_robot', point_robot_agents, adapt_act_sel),
+                                  ('tick_par_point_robot', point_robot_agents, par_act_sel),
+                                  ('tick_adapt_battery', battery_agents, adapt_act_sel)):
+        agents, obs = build()
+        cases.append((name, lambda agents=agents, obs=obs, selector=selector: selector(agents, list(obs))))
+
+    # Scaling sweeps, one parameter at a time around 4 factors of 2 states and 2 actions with a chain of preconditions
+    sweeps = (('factors', [2, 4, 8] if quick else [2, 4, 8, 16, 32]),
+              ('states', [2, 8, 32] if quick else [2, 8, 32, 128]),
+              ('actions', [2, 4, 8] if quick else [2, 4, 8, 16]),
+              ('chain', [1, 2, 4] if quick else [1, 2, 4, 8, 16]))
+    for parameter, values in sweeps:
+        for value in values:
+            n_factors = value if parameter in ('factors', 'chain') else 4
+            n_states = value if parameter == 'states' else 2
+            n_actions = value if parameter == 'actions' else 2
+            if parameter == 'chain':
+                # The chain depth is the number of chained factors, the other factors are independent
+                agents, obs = synthetic_agents(value, n_states, n_actions)
+                extra, extra_obs = synthetic_agents(4, n_states, n_actions, chained=False, prefix='g')
+                agents, obs = extra[:-1] + agents, extra_obs[:-1] + obs
+            else:
+                agents, obs = synthetic_agents(n_factors, n_states, n_actions)
+            cases.append(('sweep_%s_%d' % (parameter, value), lambda agents=agents, obs=obs: adapt_act_sel(agents, list(obs))))
+    return cases
+
+
+def compare(results, baseline, threshold):
+    # Benchmarks whose median latency is slower than the baseline by more than threshold (relative)
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            ratio = result['p50_us']/baseline[name]['p50_us']
+            result['baseline_ratio'] = ratio
+            if ratio > 1 + threshold:
+                regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the decision making pipeline')
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown of the median reported as regression')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--quick', action='store_true', help='Smaller sweeps and fewer repetitions')
+    parser.add_argument('--filter', default='', help='Only run the benchmarks whose name contains this text')
+    args = parser.parse_args(argv)
+    repeat = max(args.repeat//10, 10) if args.quick else args.repeat
+
+    results = {}
+    for name, function in benchmarks(args.quick):
+        if args.filter in name:
+            results[name] = measure(function, repeat, args.warmup)
+            print('%-28s p50 %10.1f us  p99 %10.1f us  %9d B' % (name, results[name]['p50_us'], results[name]['p99_us'],
+                                                                 results[name]['peak_bytes']))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, ratio in regressions:
+            print('REGRESSION %s: %.2fx the baseline median' % (name, ratio))
+        status = 1 if regressions else 0
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
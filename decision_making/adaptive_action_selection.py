@@ -3,29 +3,45 @@
 # This function computes the next best action based on the provided mdp structures using active inference. It checks for current desired states and runs an active inference loop for the ones with
 # an active preference. When an action is selected, its preconditions are checked looking at the estimatd states in the mdp structures. If they are met, the action is selected 
 # to be executed, if not, the loop is repeted with pushed high priority preconditions. If no action is found the algorithm returns failure. 
+# If a precondition graph (see precondition_graph.py) is given, the whole chain of missing preconditions is pushed at once.
+# The inner loop is bounded by a TickBudget (see tick_budget.py), when the budget is over the outcome is 'timeout' with the action found last
+# with missing preconditions, or 'idle_timeout' if there is none.
+# If a concurrent.futures executor is given, the inference of the factors runs on it (see parallel_inference.py).
+# If a continuation is given (see selection_continuation.py), a tick which times out is resumed by the next tick with the same observations.
 
 # Author: Corrado Pezzato, TU Delft
 # Last revision: 15.11.22
 
 import numpy as np
+from decision_making.agent_bank import AgentBank
+from decision_making.precondition_index import precondition_index
+from decision_making.tick_budget import TickBudget
+from decision_making.parallel_inference import infer_factors
+from decision_making.instrumentation import logger
 
-def adapt_act_sel(agent, obs):
+def adapt_act_sel(agent, obs, graph=None, budget=None, executor=None, tracer=None, continuation=None):
     action_found = 0
     looking_for_alternatives = 0
 
     #  At each new iteration (or tick from a behavior tree if used), restore all available actions and remove high priority priors that are already satisfied
-    if type(agent) == list:
+    if isinstance(agent, list):
         n_mdps = len(agent)
     else:
         n_mdps = 1
         agent = [agent]
         obs = [obs]
+    prec_index = precondition_index(agent)   # Where every state lives and which states every action requires
+    if budget is None:
+        budget = TickBudget()   # Default budget, bounds the number of inner iterations
+    budget.start()
+    if tracer is not None:
+        tracer.begin('adapt_act_sel', agent, obs)   # Per tick trace record, see instrumentation.py
     for i in range(n_mdps):
         agent[i].reset_habits()
         for index in range(len(agent[i]._mdp.C)):  # Loop over values in the prior C
             if agent[i]._mdp.C[index] > 0 and index == obs[i]:        
                 # Remove precondition pushed since it has been met, consider log(C)
-                print('removed preference state', i)
+                logger.info('removed preference state %d', i)
                 agent[i].set_preferences(0, index)
             
     # Return success directly if desired state is met
@@ -37,48 +53,86 @@ def adapt_act_sel(agent, obs):
                 action_found = 1
                 break
 
+    # Actions inhibited for missing preconditions in this tick, and in the interrupted ticks it continues
+    inhibited = []
+    if continuation is not None and action_found == 0 and continuation.resumes(obs):
+        looking_for_alternatives = continuation.restore(agent)
+        inhibited = list(continuation.inhibited)
+
     u = [-1]*n_mdps
     current_states = ['null']*n_mdps
+    if tracer is not None:
+        tracer.mark('reset')
 
     while action_found == 0:
-        for i in range(n_mdps):
-            # Compute free energy and posterior states for each policy if an observation is vailable
-            if obs[i] != 'null':
-                if not looking_for_alternatives:
-                    agent[i].infer_states(obs[i])
-                # Compute expected free-energy and posterior over policies
-                G, u[i] = agent[i].infer_policies()
-                current_states[i] = agent[i]._mdp.state_names[np.argmax(agent[i].get_current_state())]
+        # Stop if the budget for this tick is over, the action with missing preconditions found last (in this tick or in the
+        # interrupted ticks it continues) is returned as the best decision so far
+        if budget.exhausted():
+            outcome = 'timeout'
+            curr_action = budget.pending_action or (continuation.pending_action if continuation is not None else None) or 'idle_timeout'
+            break
+        budget.iterations += 1
+        if isinstance(agent, AgentBank):
+            # Same as the loop below, for all the factors at once
+            u, current_states = agent.infer(obs, infer_states=not looking_for_alternatives)
+        elif executor is not None:
+            # Same as the loop below, with the factors running concurrently on the executor
+            u, current_states = infer_factors(agent, obs, executor, infer_states=not looking_for_alternatives)
+        else:
+            for i in range(n_mdps):
+                # Compute free energy and posterior states for each policy if an observation is vailable
+                if obs[i] != 'null':
+                    # Compute free energy and posterior states (not while looking for alternatives), then expected free-energy and posterior over policies.
+                    # A factor whose observation, preferences and belief did not change keeps its last inference, see AiAgent.is_clean
+                    u[i] = agent[i].infer(obs[i], infer_states=not looking_for_alternatives)
+                    current_states[i] = agent[i]._mdp.state_names[np.argmax(agent[i].get_current_state())]
+        if tracer is not None:
+            tracer.inferred(agent, obs, not looking_for_alternatives)
         # If all the actions are idle, we can return success since no action is required. Actions are indicated with their index according to the templates
         if np.max(u) == 0:
             if not looking_for_alternatives:
-                print("No action found for this situation")
+                logger.info("No action found for this situation")
                 outcome = 'failure'
                 curr_action = 'idle_fail'
                 break
         # Else, we check the preconditions of the selected action, push missing states, and re-run the action selection
         else:
+            current_mask = prec_index.current_mask(current_states)
             for i in range(n_mdps):
                 # Get preconditions to be satisfied for this action if it is not idle
                 if u[i] > 0:
-                    prec = agent[i]._mdp.preconditions[u[i]]
                     _unmet_prec = 0
                     # Check if the preconitions are satisfied and if not add preference with high priority on respective priors 
-                    for item in range(len(prec)):
-                        if (prec[item] not in current_states) and (prec[item]!='none'):
-                            _unmet_prec = 1
-                            looking_for_alternatives = 1
-                            # Get index of missing state and push a prior on that state
-                            for j in range(n_mdps):
-                                if prec[item] in agent[j]._mdp.state_names:
-                                    agent[j].set_preferences(2, agent[j]._mdp.state_names.index(prec[item]))  # (value, index)
-                            # Inhibit current action for the inner adaptation loop since missing preconditions
-                            agent[i].reset_habits(u[i])
+                    if prec_index.unmet(i, u[i], current_mask):
+                        _unmet_prec = 1
+                        looking_for_alternatives = 1
+                        # Push a prior on the missing states, or on their whole precondition chain if a compiled precondition graph is given
+                        for j, state_index in prec_index.missing_owners(i, u[i], current_mask, graph):
+                            agent[j].set_preferences(2, state_index)  # (value, index)
+                            budget.preconditions_pushed += 1
+                            if tracer is not None:
+                                tracer.pushed(i, u[i], j, state_index)
+                        # Inhibit current action for the inner adaptation loop since missing preconditions
+                        agent[i].reset_habits(u[i])
+                        inhibited.append((i, u[i]))
+                        budget.actions_inhibited += 1
+                        budget.pending_action = agent[i]._mdp.action_names[u[i]]
                     # If the preconditions are met after checking we can execute the action
                     if _unmet_prec == 0:
-                        print("Action found:", agent[i]._mdp.action_names[u[i]])
+                        logger.info("Action found: %s", agent[i]._mdp.action_names[u[i]])
                         action_found = 1
                         outcome = 'running'
                         curr_action = agent[i]._mdp.action_names[u[i]]
                         break
+        if tracer is not None:
+            tracer.mark('preconditions')
+    if continuation is not None:
+        # Keep the state of the loop for the next tick if it was interrupted, otherwise there is nothing to resume
+        if outcome == 'timeout':
+            continuation.save(obs, inhibited, looking_for_alternatives, budget.pending_action or continuation.pending_action)
+        else:
+            continuation.clear()
+    budget.stop()
+    if tracer is not None:
+        tracer.end(agent, outcome, curr_action, budget)
     return outcome, curr_action
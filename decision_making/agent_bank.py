@@ -0,0 +1,243 @@
+## Agent bank
+
+# This module contains a container for a list of active inference agents, one per state factor. The bank packs the A, B, C, D, E of all
+# the factors into padded arrays with masks, so that infer_states and infer_policies are computed for all the factors with a single
+# set of array operations instead of a Python loop over the agents.
+# The bank is a list of AiAgent, so it can be passed to adapt_act_sel and par_act_sel in place of the usual list of agents.
+
+import numpy as np
+from decision_making.aip_math import aip_log, normalize, softmax
+from decision_making.template_validator import validate_templates
+
+
+class AgentBank(list):
+    def __init__(self, agents=()):
+        list.__init__(self, agents)
+        self._packed_ids = None     # id of the agents the padded arrays were built for, they are built again when the list changes
+
+    def is_packed(self):
+        # True if the padded arrays match the current agents, in the same order. Any change of the list (append, sort, reverse,
+        # item assignment...) is seen here instead of in every list method
+        return self._packed_ids == tuple(id(agent) for agent in self)
+
+    def pack(self):
+        # Build the padded arrays for the static part of the agents: likelihood, transitions, ambiguity and masks
+        if len(self) == 0:
+            raise ValueError('AgentBank needs at least one agent')
+        t_horizons = set(agent.t_horizon for agent in self)
+        if len(t_horizons) > 1:
+            raise ValueError('All the agents in a bank must have the same time horizon')
+        if any(agent.search_depth is not None for agent in self):
+            raise ValueError('The tree search of search_depth is not supported by AgentBank')
+        # The templates are checked once here (see template_validator.py), the packed arrays rely on consistent shapes
+        validate_templates(self)
+
+        self.n_factors = len(self)
+        self.t_horizon = t_horizons.pop()
+        self.n_states = np.array([agent.n_states for agent in self])
+        self.n_policies = np.array([agent.n_policies for agent in self])
+        self.n_actions = np.array([agent.n_actions for agent in self])
+        S = np.max(self.n_states)
+        P = np.max(self.n_policies)
+        depth = self.t_horizon - 1
+
+        self.state_mask = np.zeros((self.n_factors, S), dtype=bool)
+        self.policy_mask = np.zeros((self.n_factors, P), dtype=bool)
+        self.likelihood_A = np.zeros((self.n_factors, S, S))
+        self.fwd_trans_V = np.zeros((self.n_factors, S, S, P, depth))
+        self.bwd_trans_V = np.zeros((self.n_factors, S, S, P, depth))
+        self.first_action = np.zeros((self.n_factors, P), dtype=int)   # First action of every policy, the habits E are per action
+        self.ambiguity_H = np.zeros((self.n_factors, S))
+        self.kappa_d = np.zeros((self.n_factors, 1))
+        for f, agent in enumerate(self):
+            n, p = agent.n_states, agent.n_policies
+            self.state_mask[f, :n] = True
+            self.policy_mask[f, :p] = True
+            self.likelihood_A[f, :n, :n] = agent.likelihood_A
+            if agent.fwd_trans_V is not None:
+                self.fwd_trans_V[f, :n, :n, :p] = agent.fwd_trans_V
+                self.bwd_trans_V[f, :n, :n, :p] = agent.bwd_trans_V
+            else:
+                # Sparse transitions are made dense to be packed with the other factors
+                B = agent.transitions.todense()
+                self.fwd_trans_V[f, :n, :n, :p] = B[:, :, agent.policy_actions]
+                self.bwd_trans_V[f, :n, :n, :p] = np.transpose(B, (1, 0, 2))[:, :, agent.policy_actions]
+            self.first_action[f, :p] = agent.policy_actions[:, 0]
+            self.ambiguity_H[f, :n] = agent.ambiguity_H
+            self.kappa_d[f] = agent._mdp.kappa_d
+
+        # Results of the last inference for all factors
+        self.post_x = np.zeros((self.n_factors, S, self.t_horizon, P))
+        self.F = np.zeros((self.n_factors, P))
+        self._packed_ids = tuple(id(agent) for agent in self)
+
+    def copy_with(self, agents):
+        # New bank for copies of the agents of this bank: the padded static arrays are shared, the results of the inference are copied
+        bank = AgentBank(agents)
+        if self.is_packed():
+            bank.__dict__.update(self.__dict__)
+            bank._packed_ids = tuple(id(agent) for agent in bank)
+            bank.post_x = self.post_x.copy()
+            bank.F = self.F.copy()
+        return bank
+
+    def _gather(self, name, width, fill):
+        # Copy a column vector (C, D or E) of every agent into a padded (n_factors, width) array
+        var = np.full((self.n_factors, width), fill)
+        for f, agent in enumerate(self):
+            value = getattr(agent._mdp, name)
+            var[f, :len(value)] = value[:, 0]
+        return var
+
+    def _active(self, obs):
+        # Indexes of the factors with an available observation
+        return np.array([f for f in range(len(self)) if obs[f] != 'null'], dtype=int)
+
+    def infer_states(self, obs):
+        # Marginal message passing for all the factors with an available observation, see AiAgent.infer_states_batched
+        if not self.is_packed():
+            self.pack()
+        active = self._active(obs)
+        if len(active) == 0:
+            return self.F, self.post_x
+        D = self._gather('D', self.state_mask.shape[1], 0.)[active]
+        obs_active = np.array([obs[f] for f in active], dtype=int)
+        post_x, F = batch_infer_states(self.likelihood_A[active], self.fwd_trans_V[active], self.bwd_trans_V[active],
+                                       self.state_mask[active], D, obs_active, self.t_horizon)
+        self.post_x[active] = post_x
+        self.F[active] = F
+
+        # Keep the agents consistent with the result of the batched inference
+        for f in active:
+            agent = self[f]
+            n, p = agent.n_states, agent.n_policies
+            agent.post_x = self.post_x[f, :n, :, :p]
+            agent.F = np.reshape(self.F[f, :p], (p, 1))
+            agent._last_inference = None
+        return self.F, self.post_x
+
+    def infer_policies(self, obs):
+        # Expected free energy, policy posterior and update of D for all the factors with an available observation, see AiAgent.infer_policies_batched
+        # Returns the selected action of each factor, -1 for the factors without observation
+        if not self.is_packed():
+            self.pack()
+        u = np.zeros(self.n_factors, dtype=int) - 1
+        active = self._active(obs)
+        if len(active) == 0:
+            return u
+        S = self.state_mask.shape[1]
+        C = self._gather('C', S, 0.)[active]
+        D = self._gather('D', S, 0.)[active]
+        E = policy_habits(self._gather('E', np.max(self.n_actions), -np.inf)[active], self.first_action[active], self.policy_mask[active])
+        G, post_pi, policy, post_x_bma, D = batch_infer_policies(self.fwd_trans_V[active], self.ambiguity_H[active], self.post_x[active],
+                                                                 self.F[active], C, D, E, self.kappa_d[active], self.t_horizon)
+        u[active] = np.take_along_axis(self.first_action[active], policy[:, None], axis=-1)[:, 0]
+
+        # Write the results back in the agents
+        for k, f in enumerate(active):
+            agent = self[f]
+            n, p = agent.n_states, agent.n_policies
+            agent.G = np.reshape(G[k, :p], (p, 1))
+            agent.post_pi = np.reshape(post_pi[k, :p], (p, 1))
+            agent.post_x_bma = post_x_bma[k, :n, :]
+            agent.u = u[f]
+            agent.plan = [int(action) for action in agent.policy_actions[policy[k]]]
+            agent._mdp.D = np.reshape(D[k, :n], (n, 1))
+            agent._last_inference = None
+            agent.record_belief_update()
+        return u
+
+    def infer(self, obs, infer_states=True):
+        # One inference step as done in the selection loops: returns the selected actions and the names of the most likely current states
+        # The factors whose agent is clean (see AiAgent.is_clean) keep their last inference and are left out of the batched kernels
+        clean = {}
+        if infer_states:
+            for f in self._active(obs):
+                if self[f].is_clean(obs[f]):
+                    clean[f] = self[f].infer(obs[f])
+        obs_dirty = ['null' if f in clean else o for f, o in enumerate(obs)]
+        D_before = [agent._mdp.D.copy() if agent.tolerance is not None else None for agent in self]
+        if infer_states:
+            self.infer_states(obs_dirty)
+        u = self.infer_policies(obs_dirty)
+        for f in self._active(obs_dirty):
+            self[f].track_inference(obs[f], D_before[f], infer_states)
+        for f, u_clean in clean.items():
+            u[f] = u_clean
+        current_states = ['null']*len(self)
+        for f in self._active(obs):
+            current_states[f] = self[f]._mdp.state_names[np.argmax(self[f].get_current_state())]
+        return list(u), current_states
+
+
+# Batched inference kernels. The arrays have any number of leading batch axes, for instance (factors,) for a bank or (robots, factors)
+# for a fleet, followed by the axes of AiAgent: states S, time T, policies P and steps of the policies T-1. The static arrays broadcast
+# against the beliefs. Padded states are excluded through state_mask, padded policies through a habit E of -inf.
+
+def batch_infer_states(A, fwd_trans_V, bwd_trans_V, state_mask, D, obs, t_horizon):
+    # A (..., S, S), fwd_trans_V and bwd_trans_V (..., S, S, P, T-1), state_mask (..., S), D (..., S), obs (...)
+    # Returns post_x (..., S, T, P) and F (..., P), see AiAgent.infer_states_batched
+    S, P = fwd_trans_V.shape[-3], fwd_trans_V.shape[-2]
+    batch = np.broadcast_shapes(A.shape[:-2], D.shape[:-1], np.shape(obs))
+    A = np.broadcast_to(A, batch + (S, S))
+    mask = state_mask[..., None]
+
+    post_x = np.zeros(batch + (S, t_horizon, P)) + (mask/np.sum(mask, axis=-2, keepdims=True))[..., None]
+    post_x[..., 0, :] = D[..., None]
+    F = np.zeros(batch + (P,))
+
+    obs_tau = np.broadcast_to(np.asarray(obs)[..., None], batch + (P,))
+    for tau in range(t_horizon):
+        if tau > 0:
+            s_tau_past = post_x[..., tau - 1, :]
+            obs_tau = np.argmax(np.einsum('...ij,...jp->...ip', A, s_tau_past), axis=-2)
+
+        # Likelihood over outcomes, column of A for the observation of every policy
+        lnA = aip_log(np.take_along_axis(A, obs_tau[..., None, :], axis=-1))
+
+        # Past messages
+        if tau == 0:
+            lnB_past = aip_log(D)[..., None]
+        else:
+            lnB_past = aip_log(np.einsum('...ijp,...jp->...ip', fwd_trans_V[..., tau - 1], s_tau_past))
+
+        # Future messages
+        if tau >= t_horizon - 1:
+            lnB_future = 0
+        else:
+            lnB_future = aip_log(np.einsum('...ijp,...jp->...ip', bwd_trans_V[..., tau], post_x[..., tau + 1, :]))
+
+        # Posterior over the states, padded states get zero probability
+        s_pi_tau = np.where(mask, lnB_past + lnB_future + lnA, -np.inf)
+        s_pi_tau = softmax(s_pi_tau, axis=-2, out=s_pi_tau)
+        post_x[..., tau, :] = s_pi_tau
+
+        # Compute F
+        F = F + np.sum(s_pi_tau*(aip_log(s_pi_tau) - lnB_past - lnA), axis=-2)
+    return post_x, F
+
+
+def batch_infer_policies(fwd_trans_V, ambiguity_H, post_x, F, C, D, E, kappa_d, t_horizon):
+    # fwd_trans_V (..., S, S, P, T-1), ambiguity_H (..., S), post_x (..., S, T, P), F (..., P), C and D (..., S), E (..., P), kappa_d (..., 1)
+    # Returns G and the policy posterior (..., P), the selected policy (...), post_x_bma (..., S, T) and the new D (..., S)
+    # Expected free-energy calculation
+    G = np.zeros(np.shape(F))
+    for future_time in range(1, t_horizon):
+        o_pi_tau = np.argmax(np.einsum('...ijp,...jp->...ip', fwd_trans_V[..., future_time-1], post_x[..., future_time-1, :]), axis=-2)
+        G = G - np.take_along_axis(C, o_pi_tau, axis=-1) + np.einsum('...s,...sp->...p', ambiguity_H, post_x[..., future_time, :])
+
+    # Policy posterior
+    post_pi = softmax(E - F - G, axis=-1)
+    u = np.argmax(post_pi, axis=-1)
+
+    # Bayesian model averaging and update of the initial state
+    post_x_bma = np.einsum('...stp,...p->...st', post_x, post_pi)
+    D = normalize(D + kappa_d*post_x_bma[..., 0], axis=-1)
+    D[D < 0.00001] = 0
+    D = normalize(D, axis=-1)
+    return G, post_pi, u, post_x_bma, D
+
+
+def policy_habits(E, first_action, policy_mask):
+    # Habits of the policies from the habits E (..., n_actions) of their first action, -inf for the padded policies
+    return np.where(policy_mask, np.take_along_axis(E, first_action, axis=-1), -np.inf)
@@ -0,0 +1,75 @@
+## Agent snapshot
+
+# This module contains a functional interface to the action selection. adapt_act_sel and par_act_sel change the agents they are given
+# (habits, preferences and beliefs), so the same list of agents cannot be used for speculative evaluations or by several threads.
+# An AgentSnapshot is an immutable copy of a list of agents: the static parts (A, B, V and the derived matrices) are shared with the
+# original agents, while C, D, E are copied and made read-only. decide() runs the selection on a working copy of a snapshot and returns
+# the decision together with a new snapshot with the updated beliefs, leaving the given snapshot untouched.
+
+import copy
+from decision_making.adaptive_action_selection import adapt_act_sel
+from decision_making.agent_bank import AgentBank
+from decision_making.policy_tree import PolicyTree
+from decision_making.workspace import Workspace
+
+_MUTABLE = ('C', 'D', 'E')    # Parts of the mdp structure which are changed by the selection
+
+
+def _copy_agent(agent, writeable):
+    # Shallow copy of an agent with its own copy of the mutable vectors, the rest is shared
+    new_agent = copy.copy(agent)
+    new_agent._mdp = copy.copy(agent._mdp)
+    for name in _MUTABLE:
+        value = getattr(agent._mdp, name).copy()
+        value.flags.writeable = writeable
+        setattr(new_agent._mdp, name, value)
+    new_agent.F = agent.F.copy()    # The free energy is updated in place by infer_states_loop
+    if getattr(agent, 'tree', None) is not None:
+        # The memoized nodes of the tree search are filled by every evaluation, every copy gets its own
+        new_agent.tree = PolicyTree(agent.tree.decimals)
+    if getattr(agent, 'workspace', None) is not None:
+        # The buffers of the workspace are updated in place, every copy gets its own
+        new_agent.workspace = Workspace()
+        if hasattr(agent, 'post_x'):
+            new_agent.post_x = agent.post_x.copy()
+    return new_agent
+
+
+class AgentSnapshot(object):
+    def __init__(self, agents):
+        if not isinstance(agents, list):
+            agents = [agents]
+        self._agents = tuple(_copy_agent(agent, False) for agent in agents)
+        self._bank = None
+        if isinstance(agents, AgentBank):
+            # Keep the padded arrays of the bank, so that working copies do not pack them again
+            if not agents.is_packed():
+                agents.pack()
+            self._bank = agents.copy_with(list(self._agents))
+
+    def __len__(self):
+        return len(self._agents)
+
+    def __getitem__(self, index):
+        return self._agents[index]
+
+    def thaw(self):
+        # Working copy of the agents, which can be changed without affecting this snapshot
+        agents = [_copy_agent(agent, True) for agent in self._agents]
+        if self._bank is not None:
+            return self._bank.copy_with(agents)
+        return agents
+
+    def get_current_states(self):
+        # Beliefs about the current state of every agent
+        return [agent._mdp.D for agent in self._agents]
+
+
+def decide(snapshot, obs, selector=adapt_act_sel, **kwargs):
+    # Run the action selection on a copy of the snapshot. Returns the result of the selector (outcome and action, or outcome and plans)
+    # and the new snapshot after the selection. The given snapshot is not changed, so decide can be called from several threads
+    if not isinstance(obs, list):
+        obs = [obs]
+    agents = snapshot.thaw()
+    outcome, result = selector(agents, obs, **kwargs)
+    return outcome, result, AgentSnapshot(agents)
@@ -8,21 +8,48 @@
 # Last revision: 15.11.22
 
 import numpy as np
-import copy
+from decision_making.aip_math import aip_log, normalize, softmax
+from decision_making.mdp_template import agent_mdp
+from decision_making.policy_tree import PolicyTree
+from decision_making.sparse_transitions import TransitionModel, prefer_sparse
+from decision_making.workspace import Workspace
 
 class AiAgent(object):
-    def __init__(self, mdp):
-        self._mdp =  copy.deepcopy(mdp)    # This contains the mdp structure for the active inference angent
+    def __init__(self, mdp, batched=True, search_depth=None, sparse='auto', workspace=False, tolerance=None, warm_start=False,
+                 n_iterations=1, free_energy_tolerance=None):
+        self._mdp = agent_mdp(mdp)         # This contains the mdp structure for the active inference angent, the static parts are shared (see mdp_template.py)
+        self.batched = batched             # If True, all policies are evaluated at once with array operations instead of a loop per policy
+        self.search_depth = search_depth   # If given, policies are continued with a tree search up to this number of steps (see policy_tree.py)
+        self.sparse = sparse               # Sparse transitions (see sparse_transitions.py): True, False, or 'auto' to use them for large factors
+        self.workspace = Workspace() if workspace else None   # Preallocated buffers reused at every tick by the batched inference (see workspace.py)
+        self.tolerance = tolerance         # If given, infer() reuses the last inference while obs, C, E and D do not change more than this (see is_clean)
+        self._last_inference = None        # (obs, C, E, D) after the last complete inference, if it can be reused
+        self.skipped_inferences = 0
+        # Message passing of the batched inference: up to n_iterations sweeps, stopping once F changes less than free_energy_tolerance.
+        # With warm_start (and a free_energy_tolerance) a call with the same observation as the previous one first tries a single sweep
+        # from the previous posteriors
+        if n_iterations < 1:
+            raise ValueError('n_iterations must be at least 1, got %r' % (n_iterations,))
+        if free_energy_tolerance is not None and not free_energy_tolerance > 0:
+            raise ValueError('free_energy_tolerance must be positive or None, got %r' % (free_energy_tolerance,))
+        self.warm_start = warm_start
+        self.n_iterations = n_iterations
+        self.free_energy_tolerance = free_energy_tolerance
+        self.state_iterations = 0          # Sweeps run by the last infer_states
+        self._posteriors_obs = None        # Observation of the posteriors post_x, used by warm_start
+        self.belief_updates = None         # While a list, the updates of D of every inference are recorded in it (see decision_cache.py)
 
         # Initialization of variables
         self.n_policies = np.shape(self._mdp.V)[0]      # Number of allowable policies
         self.n_states = np.shape(self._mdp.B)[0]        # Number of states
         self.n_actions = np.shape(self._mdp.B)[2]       # Number of controls
         self.n_outcomes = self.n_states                 # Number of sensory inputs, same as the states
-        self.t_horizon = 2                              # Time horizon to look one step ahead
+        self.policy_indexes_v = self._mdp.V             # Indexes of possible policies
+        # Actions of every policy at every step, (n_policies, depth). A one dimensional V contains policies of depth 1
+        self.policy_actions = np.reshape(self._mdp.V, (self.n_policies, -1)).astype(int)
+        self.t_horizon = self.policy_actions.shape[1] + 1   # Time horizon to look as many steps ahead as the depth of the policies
         self.F = np.zeros([self.n_policies, 1])         # Assigning local variables to this instance of the function
         # ------------------------------------------------------------------------------------------------------------------
-        self.policy_indexes_v = self._mdp.V             # Indexes of possible policies
         self.policy_post_u = np.zeros([self.n_policies, self.t_horizon])  # Initialize vector to contain posterior probabilities of actions
 
         # Normalization
@@ -34,25 +61,218 @@ class AiAgent(object):
         # Prior preferences (log probabilities) : C
         self._mdp.C = self.aip_log((self._mdp.C))       # Preferences over policies
         self._mdp.E = self.aip_log(self.aip_norm(self._mdp.E))
-        self.default_E = copy.deepcopy(self._mdp.E)
+        self.default_E = self._mdp.E.copy()
+
+        # Likelihood and transition matrices, computed once for all the agents sharing the same template
+        if isinstance(self._mdp.B, TransitionModel) and not self.batched:
+            raise ValueError('Transitions given as TransitionModel require the batched inference')
+        derived = self._mdp.template.derived
+        if self.sparse == 'auto':
+            if 'auto' not in derived:
+                derived['auto'] = prefer_sparse(self._mdp.B)     # Depends on the size and the density of B, see sparse_transitions.py
+            use_sparse = derived['auto']
+        else:
+            use_sparse = self.sparse is True
+        if use_sparse not in derived:
+            derived[use_sparse] = self.static_matrices(use_sparse)
+        self.__dict__.update(derived[use_sparse])
 
+        if self.search_depth is not None:
+            self.tree = PolicyTree()
+
+    def static_matrices(self, use_sparse):
+        # Matrices which only depend on the template, as a dict of attributes of the agent. They are shared by the agents built from
+        # the same template, so they are made read-only
+        m = {}
         # Likelihood matrix
-        self.likelihood_A = self.aip_norm(self._mdp.A)
+        m['likelihood_A'] = self.aip_norm(self._mdp.A)
+        # Ambiguity diag(A.lnA), it only depends on the likelihood so it is computed once here
+        m['ambiguity_H'] = np.diagonal(np.dot(np.transpose(m['likelihood_A']), self.aip_log(m['likelihood_A'])))
 
         # Transition matrix
-        self.fwd_trans_B = np.zeros((self.n_states, self.n_states, self.n_actions))
-        self.bwd_trans_B = np.zeros((self.n_states, self.n_states, self.n_actions))
+        m['fwd_trans_B'] = m['bwd_trans_B'] = m['transitions'] = None
+        if isinstance(self._mdp.B, TransitionModel):
+            # Sparse transitions given by the template, the dense matrices are never built
+            m['transitions'] = self._mdp.B.normalized()
+        else:
+            # Retrieve forward messages, B, and backward messages, transpose of B
+            m['fwd_trans_B'] = self.aip_norm(self._mdp.B.reshape(self.n_states, -1)).reshape(self._mdp.B.shape)
+            m['bwd_trans_B'] = np.transpose(m['fwd_trans_B'], (1, 0, 2))
+            if use_sparse:
+                m['transitions'] = TransitionModel.from_dense(m['fwd_trans_B'])
+
+        # Transition matrices stacked per policy and step, (n_states, n_states, n_policies, depth), used by the batched inference with dense transitions
+        m['fwd_trans_V'] = m['bwd_trans_V'] = None
+        if m['transitions'] is None:
+            m['fwd_trans_V'] = m['fwd_trans_B'][:, :, self.policy_actions]
+            m['bwd_trans_V'] = m['bwd_trans_B'][:, :, self.policy_actions]
 
-        for action in range(self.n_actions):
-            # Retrieve forward messages, B
-            self.fwd_trans_B[:, :, action] = self.aip_norm(self._mdp.B[:, :, action])
-            # Retrieve backward messages, transpose of B
-            self.bwd_trans_B[:, :, action] = np.transpose(self.aip_norm(self._mdp.B[:, :, action]))
+        for value in m.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        return m
 
     def infer_states(self, obs):
         # Update posterior over hidden states using marginal message passing
         # Requires A, B, list of observations over time, list of policies, prior belief about initia state
         # Returns Posterior beliefs over hidden states for each policy (s_pi_tau), and Variationl free energy for each policy 
+        self._last_inference = None
+        if self.batched:
+            if self.workspace is not None:
+                return self.infer_states_workspace(obs)
+            return self.infer_states_batched(obs)
+        return self.infer_states_loop(obs)
+
+    def infer_states_batched(self, obs):
+        # Same message passing as infer_states_loop, but every message is an (n_states, n_policies) array so that all the policies are updated at once
+        self.sparse_O = np.zeros((self.n_states, self.t_horizon))
+        warm_sweeps = 0
+        if self.warm_posteriors(obs):
+            # One sweep from the posteriors of the previous call, kept if the free energy did not change: they are still the solution
+            F_previous = self.F[:, 0].copy()
+            self.post_x = self.post_x.copy()
+            self.post_x[:, 0, :] = self._mdp.D
+            F = self.sweep_states_batched(obs)
+            if self.converged(F, F_previous):
+                return self.end_states(obs, F, 1)
+            warm_sweeps = 1
+        # Otherwise the message passing starts again from uniform beliefs, the warm start could settle on another solution
+        self.post_x = np.zeros([self.n_states, self.t_horizon, self.n_policies]) + 1.0/self.n_states
+        self.post_x[:, 0, :] = self._mdp.D
+        F_previous = None
+        for iteration in range(self.n_iterations):
+            F = self.sweep_states_batched(obs)
+            if self.converged(F, F_previous):
+                break
+            F_previous = F
+        return self.end_states(obs, F, warm_sweeps + iteration + 1)
+
+    def sweep_states_batched(self, obs):
+        # One forward sweep of the messages over time, the future messages use the posteriors of the previous sweep (or call)
+        F = np.zeros(self.n_policies)
+        obs_tau = np.zeros(self.n_policies, dtype=int) + obs
+        for tau in range(self.t_horizon):  # Loop over future time points, the policies are handled by the array operations
+            if tau > 0:
+                # Sample from likelihood given hidden state for every policy, o = A*s
+                s_tau_past = self.post_x[:, tau - 1, :]
+                obs_tau = np.argmax(np.dot(self.likelihood_A, s_tau_past), axis=0)
+
+            # Likelihood over outcomes, A times a sparse observation is the column of A of that observation
+            lnA = self.aip_log(self.likelihood_A[:, obs_tau])
+
+            # Past messages
+            if tau == 0:
+                lnB_past = self.aip_log(self._mdp.D)
+            else:
+                lnB_past = self.aip_log(self.forward_policies(s_tau_past, tau - 1))
+
+            # Future messages
+            if tau >= self.t_horizon - 1:
+                lnB_future = 0  # No information after selected time horizon
+            else:
+                lnB_future = self.aip_log(self.backward_policies(self.post_x[:, tau + 1, :], tau))
+
+            # Compute posterior for all policies at this time and store it
+            s_pi_tau = lnB_past + lnB_future + lnA
+            s_pi_tau = softmax(s_pi_tau, axis=0, out=s_pi_tau)
+            self.post_x[:, tau, :] = s_pi_tau
+
+            # Compute F
+            F = F + np.sum(s_pi_tau*(self.aip_log(s_pi_tau) - lnB_past - lnA), axis=0)
+        return F
+
+    def infer_states_workspace(self, obs):
+        # Same as infer_states_batched, writing the messages into the preallocated buffers of the workspace
+        ws = self.workspace
+        S, T, P = self.n_states, self.t_horizon, self.n_policies
+        self.sparse_O = ws.full('sparse_O', (S, T), 0.)
+        post_x = ws.get('post_x', (S, T, P))
+        F_previous = ws.get('F_previous', (P, 1))
+        warm_sweeps = 0
+        if self.warm_posteriors(obs):
+            if self.post_x is not post_x:
+                np.copyto(post_x, self.post_x)
+            np.copyto(F_previous, self.F)
+            self.post_x = post_x
+            self.post_x[:, 0, :] = self._mdp.D
+            self.F = ws.full('F', (P, 1), 0.)
+            self.sweep_states_workspace(obs)
+            if self.converged(self.F, F_previous):
+                return self.end_states(obs, self.F[:, 0], 1)
+            warm_sweeps = 1
+        self.post_x = post_x
+        self.post_x.fill(1.0/S)
+        self.post_x[:, 0, :] = self._mdp.D
+        self.F = ws.get('F', (P, 1))
+        for iteration in range(self.n_iterations):
+            self.F.fill(0.)
+            self.sweep_states_workspace(obs)
+            if self.converged(self.F, F_previous if iteration > 0 else None):
+                break
+            np.copyto(F_previous, self.F)
+        return self.end_states(obs, self.F[:, 0], warm_sweeps + iteration + 1)
+
+    def sweep_states_workspace(self, obs):
+        # Same as sweep_states_batched, adding F to self.F
+        ws = self.workspace
+        S, T, P = self.n_states, self.t_horizon, self.n_policies
+        obs_tau = ws.full('obs_tau', (P,), obs, dtype=np.intp)
+        lnA = ws.get('lnA', (S, P))
+        lnB_past = ws.get('lnB_past', (S, P))
+        lnB_future = ws.get('lnB_future', (S, P))
+        s_pi_tau = ws.get('s_pi_tau', (S, P))
+        F_tau = ws.get('F_tau', (S, P))
+        F_sum = ws.get('F_sum', (P,))
+        s_pi_work = ws.get('s_pi_work', (1, P))
+        lnD = ws.get('lnD', (S, 1))
+
+        for tau in range(T):
+            if tau > 0:
+                np.matmul(self.likelihood_A, self.post_x[:, tau - 1, :], out=s_pi_tau)
+                np.argmax(s_pi_tau, axis=0, out=obs_tau)
+
+            np.take(self.likelihood_A, obs_tau, axis=1, out=lnA)
+            aip_log(lnA, out=lnA)
+            if tau == 0:
+                np.copyto(lnB_past, aip_log(self._mdp.D, out=lnD))
+            else:
+                aip_log(self.forward_policies(self.post_x[:, tau - 1, :], tau - 1, out=lnB_past), out=lnB_past)
+            np.add(lnB_past, lnA, out=s_pi_tau)
+            if tau < T - 1:
+                aip_log(self.backward_policies(self.post_x[:, tau + 1, :], tau, out=lnB_future), out=lnB_future)
+                s_pi_tau += lnB_future
+            softmax(s_pi_tau, axis=0, out=s_pi_tau, work=s_pi_work)
+            self.post_x[:, tau, :] = s_pi_tau
+
+            # F += sum(s.(ln(s) - lnB_past - lnA))
+            aip_log(s_pi_tau, out=F_tau)
+            F_tau -= lnB_past
+            F_tau -= lnA
+            F_tau *= s_pi_tau
+            np.sum(F_tau, axis=0, out=F_sum)
+            self.F[:, 0] += F_sum
+
+    def warm_posteriors(self, obs):
+        # True if the posteriors of the previous call can seed the messages of this one. After a new observation they are far from the
+        # solution, and without a tolerance the warm start cannot be checked
+        post_x = getattr(self, 'post_x', None)
+        return self.warm_start and self.free_energy_tolerance is not None and obs == self._posteriors_obs and post_x is not None and \
+            post_x.shape == (self.n_states, self.t_horizon, self.n_policies) and self.F.shape == (self.n_policies, 1)
+
+    def end_states(self, obs, F, iterations):
+        # Store the result of infer_states after the given number of sweeps
+        self.F = np.reshape(F, (self.n_policies, 1))
+        self.state_iterations = iterations
+        self._posteriors_obs = obs
+        return self.F, self.post_x
+
+    def converged(self, F, F_previous):
+        # True if the free energy of every policy changed less than the tolerance since the previous sweep
+        return F_previous is not None and self.free_energy_tolerance is not None and \
+            np.max(np.abs(F - F_previous)) < self.free_energy_tolerance
+
+    def infer_states_loop(self, obs):
+        # Reference implementation of infer_states, looping over policies and time
         
         # Posterior states
         # ------------------------------------------------------------------------------------------------------------------
@@ -89,14 +309,14 @@ class AiAgent(object):
                 if tau == 0:
                     lnB_past = self.aip_log(self._mdp.D)
                 else: 
-                    lnB_past = self.aip_log(np.dot(self.fwd_trans_B[:, :, self.policy_indexes_v[this_policy]], s_tau_past)) 
+                    lnB_past = self.aip_log(np.dot(self.fwd_trans_B[:, :, self.policy_actions[this_policy, tau - 1]], s_tau_past)) 
 
                 # Future message
                 if tau >= self.t_horizon -1:
                     lnB_future = np.zeros([self.n_states, 1]) # No information after selected time horizon
                 else:
                     s_tau_future = np.reshape(self.post_x[:, tau + 1, this_policy], (self.n_states, 1))
-                    lnB_future = self.aip_log(np.dot(self.bwd_trans_B[:, :, self.policy_indexes_v[this_policy]], s_tau_future)) 
+                    lnB_future = self.aip_log(np.dot(self.bwd_trans_B[:, :, self.policy_actions[this_policy, tau]], s_tau_future)) 
 
                 # Compute posterior for this policy at this time    
                 s_pi_tau = self.aip_softmax(lnB_past + lnB_future + lnA)
@@ -109,6 +329,93 @@ class AiAgent(object):
         return self.F, self.post_x
 
     def infer_policies(self):
+        # Compute expected free energy and posterior over policies, then update the belief D about the current state
+        self._last_inference = None
+        if self.batched:
+            if self.workspace is not None:
+                return self.infer_policies_workspace()
+            return self.infer_policies_batched()
+        return self.infer_policies_loop()
+
+    def infer_policies_batched(self):
+        # Same computations as infer_policies_loop, with all the policies handled at once
+        # Expected free-energy calculation
+        G = np.zeros(self.n_policies)
+        for future_time in range(1, self.t_horizon):
+            # Predicted observation for every policy, considering the posterior state at the previous time and the transitions
+            o_pi_tau = np.argmax(self.forward_policies(self.post_x[:, future_time-1, :], future_time-1), axis=0)
+            # ln(o).o is zero for a sparse observation, so only the preference over the predicted outcome and the ambiguity remain
+            G = G - self._mdp.C[o_pi_tau, 0] + np.dot(self.ambiguity_H, self.post_x[:, future_time, :])
+        self.G = np.reshape(G, (self.n_policies, 1))
+        if self.search_depth is not None:
+            self.G = self.G + self.search_future()
+
+        # Policy posterior, the habits are the ones of the first action of every policy
+        self.post_pi = self.aip_softmax(self._mdp.E[self.policy_actions[:, 0]] - self.F - self.G)
+        self.set_plan(np.argmax(self.post_pi))
+
+        # Bayesian model averaging of hidden states over policies, for every time in the horizon
+        self.post_x_bma = np.dot(self.post_x, self.post_pi[:, 0])
+
+        # Update initial state to keep track for the next iteration
+        self.update_belief(self.post_x_bma[:, 0:1])
+
+        return self.G, self.u
+
+    def update_belief(self, x):
+        # Move the initial state D towards the (n_states, 1) Bayesian model average x of the current time, removing negligible probabilities
+        D = self.aip_norm(self._mdp.D + self._mdp.kappa_d*x)
+        D[D < 0.00001] = 0
+        self._mdp.D = self.aip_norm(D)
+
+    def record_belief_update(self):
+        # Keep the Bayesian model average which updated D in the last inference, while recording
+        if self.belief_updates is not None:
+            self.belief_updates.append(self.post_x_bma[:, 0:1].copy())
+
+    def infer_policies_workspace(self):
+        # Same as infer_policies_batched, writing the results into the preallocated buffers of the workspace
+        ws = self.workspace
+        S, T, P = self.n_states, self.t_horizon, self.n_policies
+        G = ws.full('G', (P, 1), 0.)
+        predicted = ws.get('lnB_past', (S, P))
+        o_pi_tau = ws.get('obs_tau', (P,), dtype=np.intp)
+        G_tau = ws.get('F_sum', (P,))
+        for future_time in range(1, T):
+            np.argmax(self.forward_policies(self.post_x[:, future_time-1, :], future_time-1, out=predicted), axis=0, out=o_pi_tau)
+            np.take(self._mdp.C[:, 0], o_pi_tau, out=G_tau)
+            G[:, 0] -= G_tau
+            np.matmul(self.ambiguity_H, self.post_x[:, future_time, :], out=G_tau)
+            G[:, 0] += G_tau
+        self.G = G
+        if self.search_depth is not None:
+            self.G = self.G + self.search_future()
+
+        self.post_pi = ws.get('post_pi', (P, 1))
+        np.take(self._mdp.E, self.policy_actions[:, 0], axis=0, out=self.post_pi)
+        self.post_pi -= self.F
+        self.post_pi -= self.G
+        softmax(self.post_pi, axis=None, out=self.post_pi, work=ws.get('post_pi_work', (1, 1)))
+        self.set_plan(np.argmax(self.post_pi))
+
+        self.post_x_bma = ws.get('post_x_bma', (S, T))
+        np.dot(self.post_x, self.post_pi[:, 0], out=self.post_x_bma)
+
+        # The belief D is updated in place, the increment, the sum and the mask of small entries also have their buffers
+        D = self._mdp.D
+        D_work = ws.get('D_work', (1, 1))
+        D_increment = ws.get('D_increment', (S, 1))
+        D_small = ws.get('D_small', (S, 1), dtype=bool)
+        np.multiply(self.post_x_bma[:, 0:1], self._mdp.kappa_d, out=D_increment)
+        D += D_increment
+        normalize(D, axis=0, out=D, work=D_work)
+        np.less(D, 0.00001, out=D_small)
+        np.copyto(D, 0., where=D_small)
+        normalize(D, axis=0, out=D, work=D_work)
+        return self.G, self.u
+
+    def infer_policies_loop(self):
+        # Reference implementation of infer_policies, looping over policies and time
         # Initialize expected free energy of policies
         self.G = np.zeros([self.n_policies, 1])
 
@@ -119,13 +426,17 @@ class AiAgent(object):
                 # Compute posterior observation considering updated posterior state and likelihood matrix
                 # o_pi_tau = np.argmax(np.dot(self.likelihood_A, np.transpose(self.post_x[:, future_time, this_policy])))
                 self.sparse_O[:, future_time] = 0
-                o_pi_tau = np.argmax(np.dot(self.fwd_trans_B[:, :, self.policy_indexes_v[this_policy]], self.post_x[:, future_time-1, this_policy]))
+                o_pi_tau = np.argmax(np.dot(self.fwd_trans_B[:, :, self.policy_actions[this_policy, future_time-1]], self.post_x[:, future_time-1, this_policy]))
                 self.sparse_O[o_pi_tau, future_time] = 1
-                self.G[this_policy] = self.G[this_policy] + np.dot(self.aip_log(self.sparse_O[:, future_time]) - np.transpose(self._mdp.C), self.sparse_O[:, future_time])+ np.dot(np.diagonal(np.dot(np.transpose(self.likelihood_A),self.aip_log(self.likelihood_A))),np.reshape(self.post_x[:, future_time, this_policy], (len(self.post_x[:, future_time, this_policy]), 1)))
+                self.G[this_policy] = self.G[this_policy] + np.dot(self.aip_log(self.sparse_O[:, future_time]) - np.transpose(self._mdp.C), self.sparse_O[:, future_time])+ np.dot(self.ambiguity_H,np.reshape(self.post_x[:, future_time, this_policy], (len(self.post_x[:, future_time, this_policy]), 1)))
+
+        if self.search_depth is not None:
+            self.G = self.G + self.search_future()
 
         # Policy posterior
-        post_pi = self.aip_softmax(self._mdp.E - self.F - self.G)
-        self.u = np.argmax(self.aip_softmax(self.aip_log(post_pi)))
+        post_pi = self.aip_softmax(self._mdp.E[self.policy_actions[:, 0]] - self.F - self.G)
+        self.post_pi = post_pi
+        self.set_plan(np.argmax(self.aip_softmax(self.aip_log(post_pi))))
         
         # Bayesian model averaging of hidden states (over policies). This only influences the posterior estimates for future states, not current ones
         # Reset variable for Bayesian model average posterior over policies and time horizon
@@ -143,26 +454,87 @@ class AiAgent(object):
 
         return self.G, self.u
         
+    def infer(self, obs, infer_states=True):
+        # One inference step as done in the selection loops, returns the selected action. With a tolerance, the step is skipped for a
+        # clean factor and the results of the last inference (F, post_x, post_pi, u) are kept
+        if infer_states and self.is_clean(obs):
+            self.skipped_inferences += 1
+            return self.u
+        D_before = self._mdp.D.copy() if self.tolerance is not None else None
+        if infer_states:
+            self.infer_states(obs)
+        G, u = self.infer_policies()
+        self.record_belief_update()
+        self.track_inference(obs, D_before, infer_states)
+        return u
+
+    def is_clean(self, obs):
+        # True if the observation, C, E and D are the same (up to the tolerance) as after the last complete inference, and that
+        # inference did not change D, so that running it again would give the same results
+        if self.tolerance is None or self._last_inference is None:
+            return False
+        last_obs, C, E, D = self._last_inference
+        return obs == last_obs and np.allclose(C, self._mdp.C, rtol=0, atol=self.tolerance) \
+            and np.allclose(E, self._mdp.E, rtol=0, atol=self.tolerance) and np.allclose(D, self._mdp.D, rtol=0, atol=self.tolerance)
+
+    def track_inference(self, obs, D_before, infer_states):
+        # Record the inputs of the inference that just ran, for is_clean. Only a complete inference which left D unchanged is reusable,
+        # an inference of the policies alone (while looking for alternatives) depends on the preferences pushed during the tick
+        self._last_inference = None
+        if self.tolerance is not None and infer_states and np.allclose(D_before, self._mdp.D, rtol=0, atol=self.tolerance):
+            self._last_inference = (obs, self._mdp.C.copy(), self._mdp.E.copy(), self._mdp.D.copy())
+
+    def forward_policies(self, s, step, out=None):
+        # Transition of the (n_states, n_policies) beliefs s with the action of every policy at step
+        if self.transitions is not None:
+            return self._copy_out(self.transitions.forward(self.policy_actions[:, step], s), out)
+        return np.einsum('ijp,jp->ip', self.fwd_trans_V[:, :, :, step], s, out=out)
+
+    def backward_policies(self, s, step, out=None):
+        # Backward messages, transposed transition of the (n_states, n_policies) beliefs s with the action of every policy at step
+        if self.transitions is not None:
+            return self._copy_out(self.transitions.backward(self.policy_actions[:, step], s), out)
+        return np.einsum('ijp,jp->ip', self.bwd_trans_V[:, :, :, step], s, out=out)
+
+    def _copy_out(self, result, out):
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    def search_future(self):
+        # Expected free energy of the best continuation of every policy up to search_depth steps, searched from the belief at the end of the policy
+        self.tree.clear()
+        G_future = np.zeros([self.n_policies, 1])
+        self.continuations = []
+        for policy in range(self.n_policies):
+            # Belief predicted at the end of the policy, from the current posterior
+            belief = self.post_x[:, 0, policy]
+            for action in self.policy_actions[policy]:
+                G, belief = self.tree.step(self, belief, action)
+            G_future[policy], continuation = self.tree.search(self, belief, self.search_depth - self.policy_actions.shape[1])
+            self.continuations.append(continuation)
+        return G_future
+
+    def set_plan(self, policy):
+        # The action to execute is the first action of the selected policy, the plan is the whole sequence of actions
+        self.u = self.policy_actions[policy, 0]
+        self.plan = [int(action) for action in self.policy_actions[policy]]
+        if self.search_depth is not None:
+            self.plan = self.plan + self.continuations[policy]
+
+    # Numerical helpers, see aip_math.py. They return new arrays and do not modify their argument
     def aip_log(self, var):
         # Natural logarithm of an element, preventing 0. The element can be a scalar, vector or matrix
-        return np.log(var + 1e-16)
+        return aip_log(var)
 
     def aip_norm(self, var):
-        # Normalisation of probability matrix (column elements sum to 1)
-        for column_id in range(np.shape(var)[1]):  # Loop over the number of columns
-            sum_column = np.sum(var[:, column_id])
-            if sum_column > 0:
-                var[:, column_id] = var[:, column_id] / sum_column  # Divide by the sum of the column
-            else:
-                var[:, column_id] = 1 / np.shape(var)[0]  # Divide by the number of rows
-        return var
+        # Normalisation of probability matrix (column elements sum to 1, uniform for columns summing to 0)
+        return normalize(var, axis=0)
 
     def aip_softmax(self, var):
-        # Function to compute the softmax of a given column array: sigma = exp(x) / sum(exp(x))
-        ex = np.exp(var)  # Compute exponential
-        for i in range(np.shape(var)[0]):
-            var[i] = ex[i] / np.sum(ex)  # Compute softmax element by element
-        return var
+        # Softmax of a given column array: sigma = exp(x) / sum(exp(x))
+        return softmax(var, axis=None)
     
     # Update observations for an agent
     def set_observation(self, obs):
@@ -186,7 +558,7 @@ class AiAgent(object):
     # Reset habits
     def reset_habits(self, index = 'none'):
         if index == 'none':
-            self._mdp.E = copy.deepcopy(self.default_E)
+            self._mdp.E = self.default_E.copy()
         else:
             self._mdp.E[index] = self.aip_log(0)
 
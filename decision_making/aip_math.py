@@ -0,0 +1,48 @@
+## Numerics
+
+# This module contains the numerical helpers of the active inference: logarithm, normalisation of probability distributions and
+# softmax. They are vectorized over any axis and never modify their input, unless the result is written into it through out.
+# The softmax subtracts the maximum before the exponential, so large values of E - F - G do not overflow.
+# AiAgent, the batched kernels of agent_bank and the fleet use these functions.
+
+import numpy as np
+
+LOG_EPS = 1e-16             # Added before the logarithm, so that log(0) is finite
+LOG_0 = np.log(LOG_EPS)     # Same as aip_log(0), used to remove a preference or inhibit an action
+
+
+def aip_log(var, out=None):
+    # Natural logarithm preventing 0. The element can be a scalar, vector or matrix
+    if out is None:
+        return np.log(np.add(var, LOG_EPS))
+    np.add(var, LOG_EPS, out=out)
+    return np.log(out, out=out)
+
+
+def normalize(var, axis=0, out=None, work=None):
+    # Normalisation of a probability matrix along axis (by default the columns sum to 1). Where the sum is not positive the
+    # distribution becomes uniform. work is an optional buffer for the sums (the shape of var with axis reduced to 1), with out and
+    # work no temporary array is allocated unless a sum is not positive
+    var = np.asarray(var, dtype=float)
+    sums = np.add.reduce(var, axis=axis, keepdims=True, out=work)
+    if out is None:
+        out = np.empty_like(var)
+    if sums.min() > 0:
+        return np.divide(var, sums, out=out)
+    positive = sums > 0
+    np.divide(var, np.where(positive, sums, 1.), out=out)
+    out[...] = np.where(positive, out, 1. / var.shape[axis])
+    return out
+
+
+def softmax(var, axis=0, out=None, work=None):
+    # sigma = exp(x) / sum(exp(x)) along axis, with the maximum subtracted so that the exponential cannot overflow.
+    # Entries equal to -inf get zero probability. work is an optional buffer for the maxima and sums, as in normalize
+    var = np.asarray(var, dtype=float)
+    shift = np.maximum.reduce(var, axis=axis, keepdims=True, out=work)
+    if not np.isfinite(shift.sum()):
+        np.copyto(shift, 0., where=~np.isfinite(shift))
+    out = np.subtract(var, shift, out=out)
+    np.exp(out, out=out)
+    out /= np.add.reduce(out, axis=axis, keepdims=True, out=shift)
+    return out
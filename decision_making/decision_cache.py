@@ -0,0 +1,100 @@
+## Decision cache
+
+# This module contains an optional memoization layer for adapt_act_sel and par_act_sel. When the observations, the preferences C and
+# the beliefs D of the agents are the same as in a previous tick, the selection would compute again the same decision, so the cached
+# decision is returned together with the C and E the agents had after that tick.
+# The belief D is not restored from the cache: the Bayesian model averages which updated D during the cached tick are recorded (see
+# AiAgent.record_belief_update) and a hit applies the same updates to the current D, so the belief keeps moving towards the
+# observations as without cache.
+# By default (exact mode) the beliefs are used as they are in the key, and the decisions and the belief trajectory are bit-identical
+# to the ones without cache; the hits come from factors whose belief has converged. With exact=False the beliefs are rounded to a number
+# of decimals, so that beliefs close to each other hit the cache; the most likely state of every factor is part of the key in both modes.
+# The key also contains the templates of the agents and the arguments given to the selector (graph, schedule, executor...), so that a
+# cache shared by several lists of agents or callers never returns a decision computed for other templates or options.
+# Entries are evicted when the cache is full (least recently used first) or when they are older than the time to live.
+
+import copy
+import time
+import numpy as np
+from collections import OrderedDict
+from decision_making.adaptive_action_selection import adapt_act_sel
+
+
+_NOT_IN_KEY = ('budget', 'tracer')
+
+
+def _hashable(value):
+    # Arguments such as graphs and executors are compared by identity, lists by content
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return (type(value), id(value)) if not isinstance(value, list) else tuple(map(_hashable, value))
+
+
+class DecisionCache(object):
+    def __init__(self, maxsize=128, ttl=None, decimals=6, exact=True, selector=adapt_act_sel):
+        self.maxsize = maxsize      # Maximum number of cached decisions
+        self.ttl = ttl              # Time to live of an entry in seconds, None for no expiration
+        self.decimals = decimals    # Decimals kept in the beliefs D to build the key, if not exact
+        self.exact = exact          # If True, the beliefs are not quantized
+        self.selector = selector    # adapt_act_sel or par_act_sel
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _key(self, agents, obs, kwargs):
+        # The budget and the tracer do not change the decision, any other argument of the selector is part of the key
+        key = [tuple(obs), tuple((name, _hashable(value)) for name, value in sorted(kwargs.items(), key=lambda item: item[0])
+                                 if name not in _NOT_IN_KEY)]
+        for agent in agents:
+            D = agent._mdp.D if self.exact else agent._mdp.D.round(self.decimals) + 0.     # + 0. removes negative zeros
+            key.append(getattr(agent._mdp, 'template', type(agent._mdp)))
+            key.append(agent._mdp.C.tobytes())
+            key.append(D.tobytes())
+            key.append(int(np.argmax(agent._mdp.D)))
+        return tuple(key)
+
+    def select(self, agent, obs, **kwargs):
+        # Same as calling the selector, using the cached decision if available
+        if not isinstance(agent, list):
+            agent = [agent]
+            obs = [obs]
+        key = self._key(agent, obs, kwargs)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and (self.ttl is None or now - entry[0] <= self.ttl):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            stamp, decision, priors = entry
+            # Priors of the cached tick, and the updates of the belief of the cached tick applied to the current belief
+            for a, (C, E, updates) in zip(agent, priors):
+                a._mdp.C = C.copy()
+                a._mdp.E = E.copy()
+                for x in updates:
+                    a.update_belief(x)
+            return copy.deepcopy(decision)
+
+        self.misses += 1
+        for a in agent:
+            a.belief_updates = []
+        try:
+            decision = self.selector(agent, obs, **kwargs)
+        finally:
+            updates = [a.belief_updates for a in agent]
+            for a in agent:
+                a.belief_updates = None
+        if decision[0] == 'timeout' or kwargs.get('lazy'):
+            return decision     # A partial result depends on the budget, and lazy plans can only be consumed once: they are not cached
+        priors = [(a._mdp.C.copy(), a._mdp.E.copy(), u) for a, u in zip(agent, updates)]
+        self._entries[key] = (now, copy.deepcopy(decision), priors)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return decision
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
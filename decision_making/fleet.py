@@ -0,0 +1,168 @@
+## Fleet
+
+# This module runs the adaptive action selection for many robots at once. All the robots share the same list of agents (the same
+# templates), but every robot has its own preferences C, habits E and beliefs D, stored as arrays of shape (robots, factors, states)
+# and (robots, factors, actions). One tick runs infer_states, infer_policies and the resolution of the preconditions of adapt_act_sel
+# for all the robots with array operations, and returns one (outcome, action) per robot.
+
+import numpy as np
+from decision_making.agent_bank import AgentBank, batch_infer_states, batch_infer_policies, policy_habits
+from decision_making.aip_math import LOG_0
+from decision_making.precondition_index import PreconditionIndex
+from decision_making.tick_budget import DEFAULT_MAX_ITERATIONS
+
+LOG_2 = np.log(2 + 1e-16)   # Preference pushed on a missing precondition, as in adapt_act_sel
+
+
+class Fleet(object):
+    def __init__(self, agents, n_robots, graph=None):
+        # agents: list of AiAgent (or AgentBank) used as template for every robot, with their current C, D, E as initial values
+        # graph: optional precondition graph, to push the whole chain of missing preconditions at once
+        bank = agents if isinstance(agents, AgentBank) else AgentBank(agents)
+        bank.pack()
+        self.bank = bank
+        self.n_robots = n_robots
+        self.n_factors = bank.n_factors
+        S = bank.state_mask.shape[1]
+        P = bank.policy_mask.shape[1]
+
+        # Per robot state
+        self.C = np.repeat(bank._gather('C', S, 0.)[None], n_robots, axis=0)
+        self.D = np.repeat(bank._gather('D', S, 0.)[None], n_robots, axis=0)
+        self.default_E = np.full((self.n_factors, np.max(bank.n_actions)), -np.inf)
+        for f, agent in enumerate(bank):
+            self.default_E[f, :agent.n_actions] = agent.default_E[:, 0]
+        self.E = np.repeat(self.default_E[None], n_robots, axis=0)
+        self.post_x = np.zeros((n_robots,) + bank.post_x.shape)
+        self.F = np.zeros((n_robots, self.n_factors, P))
+
+        # Preconditions as boolean arrays over the state names of the index
+        index = PreconditionIndex(bank)
+        names = list(index.bits)
+        K = len(names)
+        self.state_names = names
+        self.state_k = np.zeros((self.n_factors, S), dtype=int)    # Name index of every state of every factor
+        self.required = np.zeros((self.n_factors, np.max(bank.n_actions), K), dtype=bool)
+        self.owner = np.zeros((K, self.n_factors, S), dtype=bool)
+        for f, agent in enumerate(bank):
+            for s, name in enumerate(agent._mdp.state_names):
+                self.state_k[f, s] = names.index(name)
+            for a in range(agent.n_actions):
+                for k, name in enumerate(names):
+                    self.required[f, a, k] = bool(index.required[f][a] & index.bits[name])
+        for k, name in enumerate(names):
+            for f, s in index.owners.get(name, []):
+                self.owner[k, f, s] = True
+
+        # States pushed together with a missing state: the state itself, or its whole chain if a graph is given
+        self.push_closure = np.eye(K, dtype=bool)
+        if graph is not None:
+            for k, name in enumerate(names):
+                for req in graph.chain([name]):
+                    if req in index.bits:
+                        self.push_closure[k, names.index(req)] = True
+        self.action_names = [agent._mdp.action_names for agent in bank]
+
+    def tick(self, obs, max_iterations=DEFAULT_MAX_ITERATIONS):
+        # obs: (robots, factors) array of observation indexes, -1 (or 'null' in a list of lists) when an observation is not available
+        # Returns a list with one (outcome, action) per robot, as returned by adapt_act_sel
+        obs = np.array([[-1 if o == 'null' else o for o in row] for row in obs], dtype=int) if not isinstance(obs, np.ndarray) else obs
+        N, n_factors = obs.shape
+        factors = np.arange(n_factors)
+        valid = obs >= 0
+        obs_safe = np.where(valid, obs, 0)
+        results = [None]*N
+
+        # Restore all available actions and remove the pushed preferences that are already satisfied
+        self.E[:] = self.default_E
+        C_obs = np.take_along_axis(self.C, obs_safe[..., None], axis=-1)[..., 0]
+        remove = valid & (C_obs > 0)
+        robots, fs = np.nonzero(remove)
+        self.C[robots, fs, obs_safe[robots, fs]] = LOG_0
+        C_obs = np.where(remove, LOG_0, C_obs)
+
+        # Return success directly if a desired state is met
+        success = np.any(valid & (C_obs == 0), axis=1)
+        for n in np.nonzero(success)[0]:
+            results[n] = ('success', 'idle_success')
+
+        alive = ~success
+        looking = np.zeros(N, dtype=bool)   # Looking for alternatives, the states are not inferred again
+        u = np.zeros((N, n_factors), dtype=int) - 1
+        pending = [None]*N                  # Action found last with missing preconditions, returned if the tick times out
+        iterations = 0
+        while np.any(alive) and iterations < max_iterations:
+            iterations += 1
+            idx = np.nonzero(alive)[0]
+
+            # Inference for the robots still looking for an action, only the factors with an observation are updated
+            u[idx] = np.where(valid[idx], self._infer(idx, obs_safe, valid, looking), -1)
+            current = self._current_states(idx, valid)
+            u_max = np.max(u[idx], axis=1)
+
+            # All the actions are idle: failure if no precondition was pushed, otherwise keep looking as adapt_act_sel does
+            failed = idx[(u_max == 0) & ~looking[idx]]
+            for n in failed:
+                results[n] = ('failure', 'idle_fail')
+            alive[failed] = False
+
+            # Check the preconditions of the selected actions
+            check = idx[u_max != 0]
+            if len(check) == 0:
+                continue
+            u_c = u[check]
+            current_c = current[np.searchsorted(idx, check)]
+            candidate = u_c > 0
+            required = self.required[factors[None, :], np.maximum(u_c, 0)]              # (robots, factors, names)
+            unmet = required & ~current_c[:, None, :] & candidate[..., None]
+            has_unmet = np.any(unmet, axis=-1)
+            met = candidate & ~has_unmet
+
+            # The first factor with met preconditions gives the action, the factors before it push their missing preconditions
+            found = np.any(met, axis=1)
+            first = np.where(found, np.argmax(met, axis=1), n_factors)
+            process = has_unmet & (factors[None, :] < first[:, None])
+            push = np.any(unmet & process[..., None], axis=1)
+            push = (push.astype(int) @ self.push_closure.astype(int) > 0) & ~current_c
+            push_states = np.einsum('nk,kfs->nfs', push.astype(int), self.owner.astype(int)) > 0
+            self.C[check] = np.where(push_states, LOG_2, self.C[check])
+            robots, fs = np.nonzero(process)
+            self.E[check[robots], fs, u_c[robots, fs]] = LOG_0
+            looking[check[np.any(process, axis=1)]] = True
+            for k in np.nonzero(np.any(process, axis=1))[0]:
+                f = np.nonzero(process[k])[0][-1]
+                pending[check[k]] = self.action_names[f][u_c[k, f]]
+
+            for k in np.nonzero(found)[0]:
+                n = check[k]
+                results[n] = ('running', self.action_names[first[k]][u_c[k, first[k]]])
+                alive[n] = False
+
+        for n in np.nonzero(alive)[0]:
+            results[n] = ('timeout', pending[n] or 'idle_timeout')
+        return results
+
+    def _infer(self, idx, obs, valid, looking):
+        # Batched inference for the robots in idx, returns their selected actions
+        bank = self.bank
+        mask = valid[idx]
+        states = idx[~looking[idx]]
+        if len(states) > 0:
+            post_x, F = batch_infer_states(bank.likelihood_A, bank.fwd_trans_V, bank.bwd_trans_V, bank.state_mask,
+                                           self.D[states], obs[states], bank.t_horizon)
+            keep = valid[states]
+            self.post_x[states] = np.where(keep[..., None, None, None], post_x, self.post_x[states])
+            self.F[states] = np.where(keep[..., None], F, self.F[states])
+        E = policy_habits(self.E[idx], bank.first_action[None], bank.policy_mask)
+        G, post_pi, policy, post_x_bma, D = batch_infer_policies(bank.fwd_trans_V, bank.ambiguity_H, self.post_x[idx], self.F[idx],
+                                                                 self.C[idx], self.D[idx], E, bank.kappa_d, bank.t_horizon)
+        self.D[idx] = np.where(mask[..., None], D, self.D[idx])
+        return np.take_along_axis(bank.first_action[None], policy[..., None], axis=-1)[..., 0]
+
+    def _current_states(self, idx, valid):
+        # (robots in idx, names) boolean array of the most likely current states of the factors with an observation
+        current = np.zeros((len(idx), len(self.state_names)), dtype=bool)
+        k = np.take_along_axis(self.state_k[None], np.argmax(self.D[idx], axis=-1)[..., None], axis=-1)[..., 0]
+        robots, fs = np.nonzero(valid[idx])
+        current[robots, k[robots, fs]] = True
+        return current
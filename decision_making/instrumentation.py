@@ -0,0 +1,96 @@
+## Instrumentation
+
+# This module contains the logger of the package and the Tracer, which records what happens in the ticks of adapt_act_sel and
+# par_act_sel. A tracer given to a selection function (tracer=...) collects one record per tick: the observations, the outcome, the
+# number of inner iterations, the inference calls of every factor, the preconditions pushed, the time spent in every phase of the tick
+# (reset of habits and preferences, inference, precondition checks, merge of the plans) and the policy posterior of every factor. The
+# result is recorded unless the plans are lazy, and the factors which reused their last inference are not counted as inference calls.
+# The records are kept in a ring buffer of the last ticks for post-mortem analysis, and passed to the hooks added to the tracer.
+# Without a tracer the selection functions only test for None, so the instrumentation costs nothing when it is not used.
+# The messages of the selection functions go to the 'decision_making' logger, configure logging to see them.
+
+import json
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger('decision_making')
+
+DEFAULT_CAPACITY = 1000     # Number of tick records kept by a tracer
+
+
+class Tracer(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY, posteriors=True):
+        self.records = deque(maxlen=capacity)   # Last tick records, the oldest are dropped
+        self.hooks = []                         # Callables called with every tick record
+        self.posteriors = posteriors            # Keep the policy posterior of every factor in the records
+        self.totals = {'ticks': 0, 'iterations': 0, 'inference_calls': 0, 'preconditions_pushed': 0, 'actions_inhibited': 0}
+        self._record = None
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def begin(self, selector, agents, obs):
+        # Start of a tick
+        self._record = {'selector': selector, 'obs': list(obs), 'phases': {}, 'inference_calls': [0]*len(obs),
+                        'state_inference_calls': [0]*len(obs), 'pushed': []}
+        self._skipped = [agent.skipped_inferences for agent in agents]
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        # Time since the previous mark is added to phase
+        now = time.perf_counter()
+        phases = self._record['phases']
+        phases[phase] = phases.get(phase, 0.) + now - self._last
+        self._last = now
+
+    def inferred(self, agents, obs, infer_states):
+        # End of an inference pass over the factors with an observation. The factors which kept their last inference (see
+        # AiAgent.is_clean) did not run it and are not counted
+        for f, o in enumerate(obs):
+            skipped = agents[f].skipped_inferences
+            if o != 'null' and skipped == self._skipped[f]:
+                self._record['inference_calls'][f] += 1
+                if infer_states:
+                    self._record['state_inference_calls'][f] += 1
+            self._skipped[f] = skipped
+        self.mark('inference')
+
+    def pushed(self, factor, action, owner, state_index):
+        # Preference pushed on state state_index of factor owner, missing for action of factor
+        self._record['pushed'].append((factor, action, owner, state_index))
+
+    def end(self, agents, outcome, result, budget):
+        # End of a tick, the record is stored and passed to the hooks
+        record = self._record
+        self._record = None
+        record['outcome'] = outcome
+        # Lazy plans (par_act_sel with lazy=True) can only be consumed once, by the caller: they are left out of the record
+        record['lazy'] = not isinstance(result, (str, list))
+        record['result'] = None if record['lazy'] else result
+        record['elapsed'] = time.perf_counter() - self._start
+        stats = budget.stats()
+        for name in ('iterations', 'preconditions_pushed', 'actions_inhibited', 'pending_action', 'timed_out'):
+            record[name] = stats[name]
+        if self.posteriors:
+            record['post_pi'] = [agent.post_pi[:, 0].tolist() if getattr(agent, 'post_pi', None) is not None else None
+                                 for agent in agents]
+        self.records.append(record)
+        self.totals['ticks'] += 1
+        self.totals['inference_calls'] += sum(record['inference_calls'])
+        for name in ('iterations', 'preconditions_pushed', 'actions_inhibited'):
+            self.totals[name] += record[name]
+        for hook in self.hooks:
+            hook(record)
+
+    def last(self):
+        return self.records[-1] if self.records else None
+
+    def clear(self):
+        self.records.clear()
+
+    def dump(self, path):
+        # Write the records as JSON lines
+        with open(path, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + '\n')
@@ -0,0 +1,119 @@
+## MDP template
+
+# This module contains the compact model of the templates used by AiAgent. The templates (MDPIsAt, MDPIsHolding, ...) are plain objects,
+# and every agent used to keep a deep copy of its template, so agents built from the same template duplicated the static arrays.
+# compile_template turns a template into an MDPTemplate: a frozen, slotted object with read-only copies of the static parts (names, A,
+# B, V, preconditions, kappa_d) and of the initial C, D, E. Templates with the same content share the same MDPTemplate, and the matrices
+# AiAgent derives from them (normalised likelihood and transitions) are computed once and kept in MDPTemplate.derived.
+# Every agent has an AgentMDP with its own C, D, E (and observation o), the other attributes are read from the shared template.
+
+import copy
+import hashlib
+import pickle
+import threading
+import numpy as np
+from collections import OrderedDict
+
+MAX_CACHED_TEMPLATES = 256    # Number of distinct templates kept by compile_template
+
+_STATIC = ('state_name', 'state_names', 'action_names', 'V', 'B', 'A', 'preconditions', 'kappa_d')
+_MUTABLE = ('C', 'D', 'E')
+
+
+def _freeze(value):
+    # Read-only copy of an array, deep copy of anything else
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = False
+        return value
+    return copy.deepcopy(value)
+
+
+class MDPTemplate(object):
+    __slots__ = _STATIC + ('initial', 'extras', 'derived', 'key')
+
+    def __init__(self, mdp, key=None):
+        for name in _STATIC:
+            object.__setattr__(self, name, _freeze(getattr(mdp, name, None)))
+        # Initial values of C, D, E, copied by every agent. D is None if the template has no belief
+        object.__setattr__(self, 'initial', dict((name, _freeze(getattr(mdp, name, None))) for name in _MUTABLE))
+        # Any other attribute of the template, shared and read-only as the static parts
+        extras = dict((name, _freeze(value)) for name, value in vars(mdp).items() if name not in _STATIC + _MUTABLE + ('o',))
+        object.__setattr__(self, 'extras', extras)
+        object.__setattr__(self, 'derived', {})     # Matrices derived by AiAgent, see AiAgent.static_matrices
+        object.__setattr__(self, 'key', key)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('MDPTemplate is read-only')
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__ if name != 'derived')
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'derived', {})
+
+
+class AgentMDP(object):
+    # mdp structure of one agent: its own preferences C, belief D, habits E and observation o, and the shared template
+    __slots__ = ('template', 'C', 'D', 'E', 'o')
+
+    def __init__(self, template):
+        self.template = template
+        for name in _MUTABLE:
+            value = template.initial[name]
+            if value is not None:
+                setattr(self, name, np.array(value, dtype=float))
+
+    def __getattr__(self, name):
+        # Only called for the attributes which are not slots or properties, these are the extra attributes of the template
+        if name != 'template' and name in getattr(self, 'template').extras:
+            return self.template.extras[name]
+        raise AttributeError(name)
+
+
+def _static_property(name):
+    return property(lambda self: getattr(self.template, name))
+
+
+for _name in _STATIC:
+    setattr(AgentMDP, _name, _static_property(_name))
+
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def _content_key(mdp):
+    # Templates with the same class and the same content get the same key
+    content = [getattr(mdp, name, None) for name in _STATIC + _MUTABLE]
+    content.append(sorted((name, value) for name, value in vars(mdp).items() if name not in _STATIC + _MUTABLE + ('o',)))
+    digest = hashlib.sha1(pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    return (type(mdp).__module__, type(mdp).__qualname__, digest)
+
+
+def compile_template(mdp):
+    # Shared MDPTemplate for a template object (or the template of an AgentMDP)
+    if isinstance(mdp, MDPTemplate):
+        return mdp
+    if isinstance(mdp, AgentMDP):
+        return mdp.template
+    key = _content_key(mdp)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+    template = MDPTemplate(mdp, key)
+    with _templates_lock:
+        template = _templates.setdefault(key, template)
+        _templates.move_to_end(key)
+        if len(_templates) > MAX_CACHED_TEMPLATES:
+            _templates.popitem(last=False)
+    return template
+
+
+def agent_mdp(mdp):
+    # New mdp structure for an agent built from a template, with its own C, D, E
+    return AgentMDP(compile_template(mdp))
@@ -2,32 +2,47 @@
 
 # This function computes the current applicable actions to reach a desired state. The output is a list of lists containing different plans. For a list, actions
 # can be executed in parallel since do not rely to the same components (assumed one action per state is parallelizable with other actions for other states).
+# With lazy=True the plans are returned as a generator, so that a caller which only needs the first plans does not build the others.
+# With schedule=True the actions found are instead packed into batches that do not compete for the same resources, the first batch being
+# the one to execute now (see plan_scheduler.py).
 
 # Author: Corrado Pezzato, TU Delft
 # Last revision: 15.11.22
 
 import numpy as np
-import copy 
+from decision_making.agent_bank import AgentBank
+from decision_making.precondition_index import precondition_index
+from decision_making.tick_budget import TickBudget
+from decision_making.parallel_inference import infer_factors
+from decision_making.instrumentation import logger
+from decision_making.plan_generator import iter_parallel_plans, parallel_plans
+from decision_making.plan_scheduler import resource_table, schedule_batches
 
-def par_act_sel(agent, obs):
+def par_act_sel(agent, obs, graph=None, budget=None, executor=None, tracer=None, lazy=False, schedule=False):
 
     some_action_found = 0
     looking_for_alternatives = 0
     curr_action_plan = []
 
     #  At each new iteration (or tick from a behavior tree), restore all available actions and remove high priority priors that are already satisfied
-    if type(agent) == list:
+    if isinstance(agent, list):
         n_mdps = len(agent)
     else:
         n_mdps = 1
         agent = [agent]
         obs = [obs]
+    prec_index = precondition_index(agent)   # Where every state lives and which states every action requires
+    if budget is None:
+        budget = TickBudget()   # Default budget, bounds the number of inner iterations
+    budget.start()
+    if tracer is not None:
+        tracer.begin('par_act_sel', agent, obs)   # Per tick trace record, see instrumentation.py
     for i in range(n_mdps):
         agent[i].reset_habits()
         for index in range(len(agent[i]._mdp.C)):  # Loop over values in the prior C
             if agent[i]._mdp.C[index] > 0 and index == obs[i]:        
                 # Remove precondition pushed since it has been met
-                print('removed preference state', i)
+                logger.info('removed preference state %d', i)
                 agent[i].set_preferences(0, index)
             
     # Check if we need any action at all
@@ -41,63 +56,83 @@ def par_act_sel(agent, obs):
 
     u = [-1]*n_mdps
     current_states = ['null']*n_mdps
+    if tracer is not None:
+        tracer.mark('reset')
     
     # Instead of stopping as soon as we find a solution as in adaptive_action_selection.py, keep looking for alternativ actions after removing already found ones 
     while True and 'idle_success' not in curr_action_plan:
-        for i in range(n_mdps):
-            # Compute free energy and posterior states for each policy if an observation is vailable
-            if obs[i] != 'null':
-                if not looking_for_alternatives:
-                    agent[i].infer_states(obs[i])
-                # Compute expected free-energy and posterior over policies
-                G, u[i] = agent[i].infer_policies()
-                current_states[i] = agent[i]._mdp.state_names[np.argmax(agent[i].get_current_state())]
+        # Stop if the budget for this tick is over, the plans are made with the actions found so far
+        if budget.exhausted():
+            outcome = 'timeout'
+            break
+        budget.iterations += 1
+        if isinstance(agent, AgentBank):
+            # Same as the loop below, for all the factors at once
+            u, current_states = agent.infer(obs, infer_states=not looking_for_alternatives)
+        elif executor is not None:
+            # Same as the loop below, with the factors running concurrently on the executor
+            u, current_states = infer_factors(agent, obs, executor, infer_states=not looking_for_alternatives)
+        else:
+            for i in range(n_mdps):
+                # Compute free energy and posterior states for each policy if an observation is vailable
+                if obs[i] != 'null':
+                    # Compute free energy and posterior states (not while looking for alternatives), then expected free-energy and posterior over policies.
+                    # A factor whose observation, preferences and belief did not change keeps its last inference, see AiAgent.is_clean
+                    u[i] = agent[i].infer(obs[i], infer_states=not looking_for_alternatives)
+                    current_states[i] = agent[i]._mdp.state_names[np.argmax(agent[i].get_current_state())]
+        if tracer is not None:
+            tracer.inferred(agent, obs, not looking_for_alternatives)
         # If all the actions are idle, we can return success since no action is required
         if np.max(u) == 0:
             if not looking_for_alternatives and some_action_found == 0:
-                print("No action found for this situation")
+                logger.info("No action found for this situation")
                 outcome = 'failure'
                 break
             if some_action_found >= 1:
                 break
         else:
+            current_mask = prec_index.current_mask(current_states)
             for i in range(n_mdps):
                 # Get preconditions to be satisfied for this action if it is not idle
                 if u[i] > 0:
-                    prec = agent[i]._mdp.preconditions[u[i]]
                     _unmet_prec = 0
                     # Check if the preconitions are satisfied and if not add preference with high priority on respective priors 
-                    for item in range(len(prec)):
-                        if (prec[item] not in current_states) and (prec[item]!='none'):
-                            _unmet_prec = 1
-                            looking_for_alternatives = 1
-                            #print('There are unmet preconditions for action', agent[i]._mdp.action_names[u[i]])
-                            # Get index of missing state and push a prior on that state
-                            for j in range(n_mdps):
-                                if prec[item] in agent[j]._mdp.state_names:
-                                    agent[j].set_preferences(2, agent[j]._mdp.state_names.index(prec[item]))  # (value, index)
-                            # Inhibit current action for the inner adaptation loop since missing preconditions
-                            agent[i].reset_habits(u[i])
-                        # If the preconditions are met after checking we can execute the action
+                    if prec_index.unmet(i, u[i], current_mask):
+                        _unmet_prec = 1
+                        looking_for_alternatives = 1
+                        #print('There are unmet preconditions for action', agent[i]._mdp.action_names[u[i]])
+                        # Push a prior on the missing states, or on their whole precondition chain if a compiled precondition graph is given
+                        for j, state_index in prec_index.missing_owners(i, u[i], current_mask, graph):
+                            agent[j].set_preferences(2, state_index)  # (value, index)
+                            budget.preconditions_pushed += 1
+                            if tracer is not None:
+                                tracer.pushed(i, u[i], j, state_index)
+                        # Inhibit current action for the inner adaptation loop since missing preconditions
+                        agent[i].reset_habits(u[i])
+                        budget.actions_inhibited += 1
+                        budget.pending_action = agent[i]._mdp.action_names[u[i]]
+                    # If the preconditions are met after checking we can execute the action
                     if _unmet_prec == 0:
                         agent[i].reset_habits(u[i])
                         some_action_found += 1
                         outcome = 'running'
                         curr_action_plan.append([agent[i]._mdp.action_names[u[i]], i])
+        if tracer is not None:
+            tracer.mark('preconditions')
     
-    # Parallelize current applicable actions
+    # Parallelize current applicable actions, with one action per factor in every plan (see plan_generator.py)
     parall_plans = []
     if 'idle_success' not in curr_action_plan:
-        for index in range(len(curr_action_plan)):
-            parall_plans.append(list(copy.deepcopy(curr_action_plan[index])))
-            for k in range(len(curr_action_plan)):
-                if curr_action_plan[k][1] not in parall_plans[index]:
-                    parall_plans[index].append(copy.deepcopy(curr_action_plan[k][0]))
-                    parall_plans[index].append(copy.deepcopy(curr_action_plan[k][1]))
-
-        # Remove component numbers and duplicates
-        for index in range(len(curr_action_plan)):
-            parall_plans[index] = [x for x in parall_plans[index] if not isinstance(x, int)]
-        parall_plans = list(map(list, set(map(tuple, map(set, parall_plans)))))
+        if schedule:
+            # Batches of actions using disjoint resources, declared per action in the templates
+            parall_plans = schedule_batches(curr_action_plan, resource_table(agent))
+            if lazy:
+                parall_plans = iter(parall_plans)
+        else:
+            parall_plans = iter_parallel_plans(curr_action_plan) if lazy else parallel_plans(curr_action_plan)
 
+    budget.stop()
+    if tracer is not None:
+        tracer.mark('plans')
+        tracer.end(agent, outcome, parall_plans, budget)
     return outcome, parall_plans
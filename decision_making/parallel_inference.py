@@ -0,0 +1,56 @@
+## Parallel inference
+
+# This module runs the inference of every state factor (infer_states and infer_policies) on a concurrent.futures executor. The factors
+# are independent until the preconditions are checked, so their inference can run concurrently.
+# With a ThreadPoolExecutor (or any executor sharing memory) the agents are updated in place. With a ProcessPoolExecutor the agents are
+# sent to the worker processes and the results of the inference are copied back into the agents.
+# Results are collected in the order of the agents, so the selection is the same as with the sequential loop.
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+_RESULTS = ('F', 'post_x', 'sparse_O', 'G', 'u', 'plan', 'post_pi', 'post_x_bma', '_last_inference')    # Attributes of the agent set by the inference
+
+
+def _infer_factor(agent, obs, infer_states):
+    # Inference for one factor, as in the loop of the selection functions
+    return agent.infer(obs, infer_states)
+
+
+def _infer_factor_remote(agent, obs, infer_states):
+    # Inference for one factor in another process, returns what must be copied back into the local agent
+    _infer_factor(agent, obs, infer_states)
+    results = dict((name, getattr(agent, name)) for name in _RESULTS if hasattr(agent, name))
+    return results, agent._mdp.D
+
+
+def infer_factors(agents, obs, executor, infer_states=True):
+    # Inference for all the factors with an available observation. Returns the selected actions and the names of the most likely
+    # current states, -1 and 'null' for the factors without observation
+    u = [-1]*len(agents)
+    current_states = ['null']*len(agents)
+    active = [i for i in range(len(agents)) if obs[i] != 'null']
+    # Clean factors keep their last inference (see AiAgent.is_clean), they are not sent to the executor
+    dirty = []
+    for i in active:
+        if infer_states and agents[i].is_clean(obs[i]):
+            u[i] = agents[i].infer(obs[i], infer_states)
+        else:
+            dirty.append(i)
+
+    if isinstance(executor, ProcessPoolExecutor):
+        futures = [executor.submit(_infer_factor_remote, agents[i], obs[i], infer_states) for i in dirty]
+        for i, future in zip(dirty, futures):
+            results, D = future.result()
+            agents[i].__dict__.update(results)
+            agents[i]._mdp.D = D
+            agents[i].record_belief_update()
+            u[i] = results['u']
+    else:
+        futures = [executor.submit(_infer_factor, agents[i], obs[i], infer_states) for i in dirty]
+        for i, future in zip(dirty, futures):
+            u[i] = future.result()
+
+    for i in active:
+        current_states[i] = agents[i]._mdp.state_names[np.argmax(agents[i].get_current_state())]
+    return u, current_states
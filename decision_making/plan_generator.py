@@ -0,0 +1,37 @@
+## Plan generator
+
+# This module builds the parallel plans of par_act_sel from the actions it found in a tick. Actions of different factors can run in
+# parallel, so a plan contains at most one action per factor. The candidate actions are grouped by the factor owning them; every
+# candidate gives one plan made of itself and of the first candidate found for every other factor.
+# Plans are generated lazily, in the order the candidates were found, with the actions of a plan ordered by factor. Duplicated plans
+# are skipped, so a caller which only needs the first plans does not pay for the others.
+
+import itertools
+from collections import OrderedDict
+
+
+def group_by_factor(candidates):
+    # candidates: list of (action name, factor) in the order they were found. Returns an ordered dict factor -> list of action names
+    groups = OrderedDict()
+    for name, factor in candidates:
+        names = groups.setdefault(factor, [])
+        if name not in names:
+            names.append(name)
+    return groups
+
+
+def iter_parallel_plans(candidates):
+    # Generator of the distinct plans, as lists of action names ordered by factor
+    groups = group_by_factor(candidates)
+    factors = sorted(groups)
+    seen = set()
+    for name, factor in candidates:
+        plan = tuple(name if f == factor else groups[f][0] for f in factors)
+        if plan not in seen:
+            seen.add(plan)
+            yield list(plan)
+
+
+def parallel_plans(candidates, max_plans=None):
+    # List of the first max_plans distinct plans, all of them if max_plans is None
+    return list(itertools.islice(iter_parallel_plans(candidates), max_plans))
@@ -0,0 +1,68 @@
+## Plan scheduler
+
+# This module packs the actions found by par_act_sel into batches of actions that can really run at the same time. Templates can
+# declare the resources every action uses (self.resources, one list of names per action, such as ['right_arm', 'base']); two actions
+# conflict if they belong to the same factor or if they share a resource. Templates without resources only conflict within a factor,
+# as the plans of par_act_sel assume.
+# As in precondition_index.py every resource gets one bit, so the resources of an action are an integer and a conflict is a single
+# bitwise and. The batches are a greedy coloring of the conflict graph: the actions are taken by increasing number of conflicts (ties
+# in the order par_act_sel found them) and every action goes in the first batch it does not conflict with. The first batch is then
+# maximal, no other candidate can be added to it, and every next batch is maximal among the actions left by the previous ones.
+
+from collections import OrderedDict
+from decision_making.structure_cache import StructureCache
+
+MAX_CACHED_TABLES = 16     # Number of lists of agents for which a resource table is kept
+
+
+class ResourceTable(object):
+    def __init__(self, agents):
+        self.bits = OrderedDict()   # Resource name -> bit, every factor is also a resource of its own actions
+        self.masks = []             # For every agent: action name -> bitmask of the resources it uses
+        for i, agent in enumerate(agents):
+            resources = getattr(agent._mdp, 'resources', None)
+            factor_bit = self._bit(('factor', i))
+            masks = {}
+            for action, name in enumerate(agent._mdp.action_names):
+                mask = factor_bit
+                for resource in (resources[action] if resources is not None else ()):
+                    mask |= self._bit(resource)
+                masks[name] = mask
+            self.masks.append(masks)
+
+    def _bit(self, name):
+        if name not in self.bits:
+            self.bits[name] = 1 << len(self.bits)
+        return self.bits[name]
+
+    def names(self, mask):
+        # Resource names of the bits set in mask, without the factors
+        return [name for name, bit in self.bits.items() if mask & bit and not isinstance(name, tuple)]
+
+
+_tables = StructureCache(('action_names', 'resources'), MAX_CACHED_TABLES)
+
+
+def resource_table(agents):
+    # Return the resource table of a list of agents, building it again if the agents in the list changed since the last call
+    return _tables.get(agents, ResourceTable)
+
+
+def schedule_batches(candidates, table):
+    # candidates: list of (action name, factor) as found by par_act_sel. Returns the batches as lists of action names ordered by factor,
+    # the actions of a batch do not conflict and the first batch is the one to execute now
+    unique = list(OrderedDict.fromkeys((name, factor) for name, factor in candidates))
+    masks = [table.masks[factor][name] for name, factor in unique]
+    degrees = [sum(1 for other in masks if other & mask) - 1 for mask in masks]
+    batches = []
+    used = []
+    for k in sorted(range(len(unique)), key=lambda k: degrees[k]):
+        for b in range(len(batches)):
+            if not used[b] & masks[k]:
+                batches[b].append(unique[k])
+                used[b] |= masks[k]
+                break
+        else:
+            batches.append([unique[k]])
+            used.append(masks[k])
+    return [[name for name, factor in sorted(batch, key=lambda action: action[1])] for batch in batches]
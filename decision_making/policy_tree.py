@@ -0,0 +1,60 @@
+## Policy tree
+
+# This module contains tools for policies longer than one step.
+# expand_policies enumerates all the sequences of actions of a given depth, to be used as V matrix (n_policies, depth) in a template.
+# The number of such policies grows as actions^depth, so PolicyTree evaluates deep policies with a tree search instead: from a belief,
+# every action gives a predicted belief and a predicted (sparse) observation, as in AiAgent.infer_policies, and the search continues
+# from the belief updated with that observation. Belief nodes are memoized, so the cost grows with the number of distinct beliefs that
+# can be reached and not with the number of action sequences. With sparse observations and identity likelihoods, as in the templates,
+# there are at most n_states distinct beliefs after the first step.
+# The tree only holds the memoized nodes, the agent is given to every call, so copies of an agent (see agent_snapshot.py) never read the
+# preferences of another agent through the tree.
+
+import itertools
+import numpy as np
+
+
+def expand_policies(n_actions, depth):
+    # All the sequences of depth actions, as a (n_actions**depth, depth) V matrix
+    return np.array(list(itertools.product(range(n_actions), repeat=depth)), dtype=int).reshape(-1, depth)
+
+
+class PolicyTree(object):
+    def __init__(self, decimals=8):
+        self.decimals = decimals    # Beliefs are rounded to this number of decimals to be memoized
+        self.clear()
+
+    def clear(self):
+        # The memoized nodes depend on the preferences C, so they are cleared at every evaluation
+        self._nodes = {}
+        self.expanded = 0
+
+    def step(self, agent, belief, action):
+        # Expected free energy of one action of agent from a belief, and the belief after the predicted observation
+        if agent.transitions is not None:
+            predicted = agent.transitions.forward(action, belief)
+        else:
+            predicted = np.dot(agent.fwd_trans_B[:, :, action], belief)
+        o_pi_tau = np.argmax(np.dot(agent.likelihood_A, predicted))
+        G = -agent._mdp.C[o_pi_tau, 0] + np.dot(agent.ambiguity_H, predicted)   # ln(o).o is zero for a sparse observation
+        posterior = agent.likelihood_A[o_pi_tau, :]*predicted
+        total = np.sum(posterior)
+        posterior = posterior/total if total > 0 else predicted
+        return G, posterior
+
+    def search(self, agent, belief, depth):
+        # Minimum expected free energy over the sequences of depth actions starting from belief, and the best sequence
+        if depth <= 0:
+            return 0., []
+        key = (np.round(belief, self.decimals).tobytes(), depth)
+        if key in self._nodes:
+            return self._nodes[key]
+        self.expanded += 1
+        best = (np.inf, [])
+        for action in range(agent.n_actions):
+            G, posterior = self.step(agent, belief, action)
+            G_future, plan = self.search(agent, posterior, depth - 1)
+            if G + G_future < best[0]:
+                best = (G + G_future, [action] + plan)
+        self._nodes[key] = best
+        return best
@@ -0,0 +1,158 @@
+## Precondition graph
+
+# This module compiles a set of MDP templates into a static graph of states, the actions that achieve them, and the preconditions of
+# those actions. A state can have several achievers: it is reachable if one of them has all its preconditions reachable. The graph is
+# checked once for states that no chain of actions can achieve and for the cycles of preconditions that make them unreachable, and it
+# stores for every state the full chain of preconditions needed to achieve it through one chosen achiever.
+# adapt_act_sel and par_act_sel can use the chain to push all the missing preconditions of an action at once, instead of discovering
+# them one link per inference pass.
+
+import numpy as np
+from collections import OrderedDict
+from decision_making.sparse_transitions import TransitionModel
+
+
+class PreconditionCycleError(ValueError):
+    pass
+
+
+def _achieved_states(B, action):
+    # Boolean array of the states that action can reach from another state, for dense transitions or a TransitionModel
+    if isinstance(B, TransitionModel):
+        n = B.n_states
+        achieved = np.zeros(n, dtype=bool)
+        if B.next_states[action] is not None:
+            next_state = B.next_states[action]
+            achieved[next_state[next_state != np.arange(n)]] = True
+        else:
+            indptr, indices, data = B.csr[action]
+            rows = np.repeat(np.arange(n), np.diff(indptr))
+            achieved[rows[(indices != rows) & (data > 0)]] = True
+        return achieved
+    moves = np.asarray(B)[:, :, action] > 0
+    np.fill_diagonal(moves, False)
+    return np.any(moves, axis=1)
+
+
+class PreconditionGraph(object):
+    def __init__(self, templates, allow_cycles=False):
+        # Accept both templates and agents built from templates
+        mdps = [getattr(template, '_mdp', template) for template in templates]
+
+        self.owners = OrderedDict()     # State name -> list of (factor index, state index)
+        self.achievers = OrderedDict()  # State name -> list of (factor index, action index) of the actions leading to that state
+        self.requires = {}              # (factor index, action index) -> list of state names required by that action
+        self.action_names = {}          # (factor index, action index) -> action name
+
+        for f, mdp in enumerate(mdps):
+            for s, name in enumerate(mdp.state_names):
+                self.owners.setdefault(name, []).append((f, s))
+                self.achievers.setdefault(name, [])
+            B = mdp.B
+            for a in range(np.shape(B)[2]):
+                self.action_names[(f, a)] = mdp.action_names[a]
+                self.requires[(f, a)] = [name for name in OrderedDict.fromkeys(mdp.preconditions[a]) if name != 'none']
+                for name in self.requires[(f, a)]:
+                    self.achievers.setdefault(name, [])
+                # An action achieves a state if it can bring the factor there from another state. The idle action achieves nothing
+                for s in np.nonzero(_achieved_states(B, a))[0]:
+                    self.achievers[mdp.state_names[s]].append((f, a))
+
+        # State name -> list of state names it depends on through any of its achievers
+        self.depends = OrderedDict()
+        for name, achievers in self.achievers.items():
+            self.depends[name] = list(OrderedDict.fromkeys(req for action in achievers for req in self.requires[action]))
+
+        # State name -> achiever used for the chains, the first one whose preconditions are reachable without the state itself
+        self.chosen = {}
+        self.reachable = self._find_reachable()
+        self.unreachable = [name for name in self.achievers if name not in self.reachable]
+        # A cycle is only an error if it blocks reachability: the states that can be achieved through another achiever are left out
+        self.cycles = self._find_cycles(self.unreachable)
+        if self.cycles and not allow_cycles:
+            raise PreconditionCycleError('Cyclic preconditions: ' + '; '.join(' -> '.join(cycle) for cycle in self.cycles))
+        self.chains = dict((name, self._chain(name)) for name in self.achievers)
+
+    def _find_cycles(self, names):
+        # Depth first search on the dependencies between the given states, a back edge closes a cycle
+        cycles = []
+        color = dict((name, 0) for name in names)   # 0 not visited, 1 on the current path, 2 done
+        path = []
+
+        def visit(name):
+            color[name] = 1
+            path.append(name)
+            for req in self.depends[name]:
+                if req not in color:
+                    continue
+                if color[req] == 1:
+                    cycles.append(path[path.index(req):] + [req])
+                elif color[req] == 0:
+                    visit(req)
+            path.pop()
+            color[name] = 2
+
+        for name in names:
+            if color[name] == 0:
+                visit(name)
+        return cycles
+
+    def _find_reachable(self):
+        # A state is reachable offline if some action achieves it and all the preconditions of that action are reachable. That action
+        # is the chosen achiever of the state, its preconditions were found reachable before the state so the chosen achievers have no cycle
+        reachable = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, achievers in self.achievers.items():
+                if name in reachable:
+                    continue
+                for action in achievers:
+                    if all(req in reachable for req in self.requires[action]):
+                        reachable.add(name)
+                        self.chosen[name] = action
+                        changed = True
+                        break
+        return reachable
+
+    def _requires_state(self, name):
+        # Preconditions of the achiever used for name: the chosen one, or the first one for an unreachable state
+        action = self.chosen.get(name)
+        if action is None:
+            action = self.achievers[name][0] if self.achievers[name] else None
+        return self.requires[action] if action is not None else []
+
+    def _chain(self, name):
+        # All the states needed to achieve name, ordered so that every state comes after the states it depends on
+        chain = OrderedDict()
+        visiting = set()
+
+        def visit(state):
+            if state in chain or state in visiting:
+                return
+            visiting.add(state)
+            for req in self._requires_state(state):
+                visit(req)
+            visiting.discard(state)
+            chain[state] = None
+
+        for req in self._requires_state(name):
+            visit(req)
+        return list(chain)
+
+    def chain(self, names):
+        # Full precondition chain of a list of states, including the states themselves, each state after its own preconditions
+        result = OrderedDict()
+        for name in names:
+            for state in self.chains.get(name, []):
+                result[state] = None
+            result[name] = None
+        return list(result)
+
+    def is_reachable(self, name):
+        return name in self.reachable
+
+
+def compile_precondition_graph(templates, allow_cycles=False):
+    # Compile a list of MDP templates (or agents) into a precondition graph, raises PreconditionCycleError for cyclic preconditions
+    return PreconditionGraph(templates, allow_cycles)
@@ -0,0 +1,83 @@
+## Precondition index
+
+# This module precomputes, for a list of agents, where every state name lives and which states every action requires.
+# Every state name that appears in the templates (as a state of a factor or as a precondition) gets one bit, so the set of current
+# states and the preconditions of an action are integers, and checking the preconditions of an action is a single bitwise operation.
+# The index is used by adapt_act_sel and par_act_sel to check the preconditions and to push the missing ones without scanning the
+# state names of all the agents.
+
+from collections import OrderedDict
+from decision_making.structure_cache import StructureCache
+
+MAX_CACHED_INDEXES = 16   # Number of lists of agents for which an index is kept
+
+
+class PreconditionIndex(object):
+    def __init__(self, agents):
+        self.n_agents = len(agents)
+        self.bits = {}        # State name -> bit
+        self.owners = {}      # State name -> list of (agent index, state index) of the agents owning that state
+
+        for i, agent in enumerate(agents):
+            for index, name in enumerate(agent._mdp.state_names):
+                self._bit(name)
+                self.owners.setdefault(name, []).append((i, index))
+
+        # For every agent and action: bitmask of the required states, and list of (bit, owners) to push them when unmet
+        self.required = []
+        self.required_owners = []
+        for agent in agents:
+            required_agent = []
+            owners_agent = []
+            for prec in agent._mdp.preconditions:
+                names = [name for name in OrderedDict.fromkeys(prec) if name != 'none']
+                mask = 0
+                for name in names:
+                    mask |= self._bit(name)
+                required_agent.append(mask)
+                owners_agent.append([(self.bits[name], self.owners.get(name, [])) for name in names])
+            self.required.append(required_agent)
+            self.required_owners.append(owners_agent)
+
+    def _bit(self, name):
+        if name not in self.bits:
+            self.bits[name] = 1 << len(self.bits)
+        return self.bits[name]
+
+    def current_mask(self, current_states):
+        # Bitmask of the current states, 'null' for the factors without observation
+        mask = 0
+        for name in current_states:
+            if name != 'null':
+                mask |= self.bits[name]
+        return mask
+
+    def unmet(self, i, action, current_mask):
+        # Bitmask of the preconditions of action of agent i that are not in the current states
+        return self.required[i][action] & ~current_mask
+
+    def missing_owners(self, i, action, current_mask, graph=None):
+        # (agent index, state index) of the states that must be pushed to satisfy the preconditions of action of agent i
+        # If a precondition graph is given, the states of the whole precondition chain of the missing states are returned
+        if graph is not None:
+            for name in graph.chain([name for name in self.names(self.unmet(i, action, current_mask))]):
+                if not current_mask & self.bits.get(name, 0):
+                    for owner in self.owners.get(name, []):
+                        yield owner
+            return
+        for bit, owners in self.required_owners[i][action]:
+            if not current_mask & bit:
+                for owner in owners:
+                    yield owner
+
+    def names(self, mask):
+        # State names of the bits set in mask
+        return [name for name, bit in self.bits.items() if mask & bit]
+
+
+_indexes = StructureCache(('state_names', 'preconditions'), MAX_CACHED_INDEXES)
+
+
+def precondition_index(agents):
+    # Return the index for a list of agents, building it again if the agents in the list changed since the last call
+    return _indexes.get(agents, PreconditionIndex)
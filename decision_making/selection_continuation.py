@@ -0,0 +1,56 @@
+## Selection continuation
+
+# This module contains the continuation of adapt_act_sel, which makes the action selection anytime: a tick bounded by a TickBudget can
+# stop in the middle of the precondition loop and the next tick continues from where it stopped instead of starting over.
+# The preferences pushed on missing preconditions already stay in the priors C between ticks. What a new tick loses is the rest of the
+# inner loop: the actions inhibited because of missing preconditions (the habits E are restored at every tick) and the fact that the
+# states were already inferred for these observations. A continuation given to adapt_act_sel (continuation=...) keeps them when a tick
+# times out; the next tick with the same observations restores them and goes on with the precondition loop. New observations discard
+# the continuation, since the inhibited actions may be applicable again.
+# The action with missing preconditions found last is kept as pending_action, the best partial result while the loop is unfinished.
+
+class SelectionContinuation(object):
+    def __init__(self):
+        self.obs = None                 # Observations of the interrupted tick, None if there is nothing to resume
+        self.inhibited = []             # (factor, action) inhibited for missing preconditions in the interrupted ticks
+        self.looking_for_alternatives = 0
+        self.pending_action = None      # Last action found with missing preconditions
+        self.resumed_ticks = 0          # Ticks which resumed an interrupted one
+        self.discarded = 0              # Interrupted ticks not resumed because the observations changed
+
+    def pending(self):
+        return self.obs is not None
+
+    def resumes(self, obs):
+        # True if a tick with these observations continues the interrupted one. Different observations discard it
+        if self.obs is None:
+            return False
+        if list(obs) != self.obs:
+            self.discarded += 1
+            self.clear()
+            return False
+        self.resumed_ticks += 1
+        return True
+
+    def restore(self, agent):
+        # Inhibit again the actions of the interrupted ticks, after the habits of the new tick are reset
+        for i, action in self.inhibited:
+            agent[i].reset_habits(action)
+        return self.looking_for_alternatives
+
+    def save(self, obs, inhibited, looking_for_alternatives, pending_action):
+        # Keep the state of a tick which timed out
+        self.obs = list(obs)
+        self.inhibited = list(inhibited)
+        self.looking_for_alternatives = looking_for_alternatives
+        self.pending_action = pending_action
+
+    def clear(self):
+        self.obs = None
+        self.inhibited = []
+        self.looking_for_alternatives = 0
+        self.pending_action = None
+
+    def stats(self):
+        return {'pending': self.pending(), 'inhibited': len(self.inhibited), 'pending_action': self.pending_action,
+                'resumed_ticks': self.resumed_ticks, 'discarded': self.discarded}
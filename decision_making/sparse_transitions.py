@@ -0,0 +1,124 @@
+## Sparse transitions
+
+# This module contains a compact representation of the transition matrices B of a factor. Most actions in the templates are
+# deterministic ("set to true" transitions such as [[1, 1], [0, 0]]): they are stored as an index array with the next state of every
+# state. The other actions are stored in compressed sparse row form (indptr, indices, data).
+# AiAgent uses this representation for factors with many states, for instance grid locations, so that the memory and the time of the
+# inference grow with the number of non-zero transitions instead of n_states^2. A template can also give B directly as a
+# TransitionModel, without ever building the dense matrices.
+
+import numpy as np
+
+# With 'auto', factors with at least SPARSE_MIN_STATES states and at most SPARSE_MAX_DENSITY non-zero transitions use the sparse
+# representation. Below that the dense einsum is faster: with 8 actions the sparse inference was slower up to 128 states, and 4 to 6
+# times faster from 512 states
+SPARSE_MIN_STATES = 512
+SPARSE_MAX_DENSITY = 0.1
+
+
+def prefer_sparse(B):
+    # True if the sparse representation should be used for the transitions B of a factor with sparse='auto'
+    if isinstance(B, TransitionModel):
+        return True
+    return np.shape(B)[0] >= SPARSE_MIN_STATES and np.count_nonzero(B) <= SPARSE_MAX_DENSITY*np.size(B)
+
+
+class TransitionModel(object):
+    def __init__(self, n_states, next_states=None, csr=None):
+        # next_states: list with, for every action, an index array of the next state of every state, or None for stochastic actions
+        # csr: list with, for every action, a tuple (indptr, indices, data) of B[:, :, action] in CSR form, or None for deterministic actions
+        n_actions = len(next_states) if next_states is not None else len(csr)
+        self.n_states = n_states
+        self.n_actions = n_actions
+        self.next_states = list(next_states) if next_states is not None else [None]*n_actions
+        self.csr = list(csr) if csr is not None else [None]*n_actions
+        self.shape = (n_states, n_states, n_actions)
+
+    @classmethod
+    def from_dense(cls, B):
+        # Build the model from a dense (n_states, n_states, n_actions) array, the columns are normalized as in AiAgent.aip_norm
+        B = np.asarray(B, dtype=float)
+        n_states = B.shape[0]
+        next_states = []
+        csr = []
+        for action in range(B.shape[2]):
+            B_a = B[:, :, action]
+            sums = np.sum(B_a, axis=0)
+            B_a = np.where(sums > 0, B_a/np.where(sums > 0, sums, 1), 1./n_states)
+            if np.all(np.count_nonzero(B_a, axis=0) == 1):
+                next_states.append(np.argmax(B_a, axis=0))
+                csr.append(None)
+            else:
+                rows, cols = np.nonzero(B_a)
+                indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_states))))
+                next_states.append(None)
+                csr.append((indptr, cols, B_a[rows, cols]))
+        return cls(n_states, next_states, csr)
+
+    @classmethod
+    def deterministic(cls, next_states):
+        # Model where every action is deterministic, next_states[action][state] is the state reached from state with action
+        next_states = [np.asarray(n, dtype=int) for n in next_states]
+        return cls(len(next_states[0]), next_states=next_states)
+
+    def normalized(self):
+        # Columns normalized to sum to one, columns without transitions become uniform as in AiAgent.aip_norm
+        csr = []
+        for action in range(self.n_actions):
+            if self.csr[action] is None:
+                csr.append(None)
+                continue
+            indptr, indices, data = self.csr[action]
+            sums = np.bincount(indices, weights=data, minlength=self.n_states)
+            if np.all(sums > 0):
+                csr.append((indptr, indices, data/sums[indices]))
+            else:
+                csr.append(TransitionModel.from_dense(self.todense()[:, :, action:action+1]).csr[0])
+        return TransitionModel(self.n_states, self.next_states, csr)
+
+    def todense(self):
+        B = np.zeros(self.shape)
+        for action in range(self.n_actions):
+            if self.next_states[action] is not None:
+                B[self.next_states[action], np.arange(self.n_states), action] = 1
+            else:
+                indptr, indices, data = self.csr[action]
+                rows = np.repeat(np.arange(self.n_states), np.diff(indptr))
+                B[rows, indices, action] = data
+        return B
+
+    def forward(self, actions, s):
+        # B[:, :, actions[k]] times s[:, k] for every column k. actions can also be a single action with s a vector
+        return self._apply(actions, s, transpose=False)
+
+    def backward(self, actions, s):
+        # B[:, :, actions[k]].T times s[:, k] for every column k
+        return self._apply(actions, s, transpose=True)
+
+    def _apply(self, actions, s, transpose):
+        if np.ndim(actions) == 0:
+            return self._apply(np.array([actions]), np.reshape(s, (-1, 1)), transpose)[:, 0]
+        actions = np.asarray(actions)
+        n = self.n_states
+        out = np.zeros((n, len(actions)))
+        for action in np.unique(actions):
+            cols = np.nonzero(actions == action)[0]
+            k = len(cols)
+            s_a = s[:, cols]
+            if self.next_states[action] is not None:
+                next_state = self.next_states[action]
+                if transpose:
+                    out[:, cols] = s_a[next_state]
+                    continue
+                rows, values = next_state, s_a
+            else:
+                indptr, indices, data = self.csr[action]
+                csr_rows = np.repeat(np.arange(n), np.diff(indptr))
+                if transpose:
+                    rows, values = indices, data[:, None]*s_a[csr_rows]
+                else:
+                    rows, values = csr_rows, data[:, None]*s_a[indices]
+            # Sum the contributions of every row with a single bincount over (row, column) pairs
+            flat = (rows[:, None]*k + np.arange(k)[None, :]).ravel()
+            out[:, cols] = np.bincount(flat, weights=np.ravel(values), minlength=n*k).reshape(n, k)
+        return out
@@ -104,9 +104,6 @@ class MDPIsLocFree:
         # Belief about initial state, D
         # -----------------------------------------------------------
         self.D = np.array([[0.5], [0.5]])
-        # Initial guess about the states d, all equally possible, this is updated over time
-        # -----------------------------------------------------------
-        self.d = np.array([[0.5], [0.5]])
         # Preference about actions, idle is slightly preferred
         # -----------------------------------------------------------
         self.E = np.array([[1.01], [1], [1]])
@@ -143,9 +140,6 @@ class MDPIsBlockAt:
         # Belief about initial state, D
         # -----------------------------------------------------------
         self.D = np.array([[0.5], [0.5]])
-        # Initial guess about the states d, all equally possible, this is updated over time
-        # -----------------------------------------------------------
-        self.d = np.array([[0.5], [0.5]])
         # Preference about actions, idle is slightly preferred
         # -----------------------------------------------------------
         self.E = np.array([[1.01], [1], [1]])
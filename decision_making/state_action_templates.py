@@ -22,6 +22,10 @@ class MDPIsAt:
         # ----------------------------------------------------------
         self.preconditions = [['none'], ['none']]    # No preconditions needed for Idle and move_to                       
 
+        # Resources used by the actions above, actions sharing a resource cannot run in parallel
+        # ----------------------------------------------------------
+        self.resources = [[], ['base']]    # move_to drives the base
+
         # Likelihood matrix matrices
         # ----------------------------------------------------------
         self.A = np.eye(2)  # Identity mapping
@@ -64,6 +68,10 @@ class MDPIsHolding:
         # Preconditions of the actions above
         self.preconditions = [['none'], ['not_holding_obj', 'reachable', 'visible'], ['not_holding_obj', 'reachable', 'visible'], ['none']] # [Idle precondition], [pickRight preconditions], [pickLeft preconditions], [place precondition]  
 
+        # Resources used by the actions above, actions sharing a resource cannot run in parallel
+        # ----------------------------------------------------------
+        self.resources = [[], ['right_arm', 'base'], ['left_arm', 'base'], ['right_arm']]    # Picking needs the base to stand still
+
         # Likelihood matrix matrices
         # ----------------------------------------------------------
         self.A = np.eye(2)  # Identity mapping
@@ -103,6 +111,10 @@ class MDPIsReachable:
         # ----------------------------------------------------------
         self.preconditions = [['none'], ['none']]    # No preconditions needed for Idle and move_to_reach                       
 
+        # Resources used by the actions above, actions sharing a resource cannot run in parallel
+        # ----------------------------------------------------------
+        self.resources = [[], ['base']]
+
         # Likelihood matrix matrices
         # ----------------------------------------------------------
         self.A = np.eye(2)  # Identity mapping
@@ -141,6 +153,10 @@ class MDPIsVisible:
         # Preconditions of the actions above
         # ----------------------------------------------------------
         self.preconditions = [['none'], ['none']]    # No preconditions needed for Idle and look_around                       
+
+        # Resources used by the actions above, actions sharing a resource cannot run in parallel
+        # ----------------------------------------------------------
+        self.resources = [[], ['head']]
            
 
         # Likelihood matrix matrices
@@ -182,6 +198,10 @@ class MDPIsPlacedAt:
         # ----------------------------------------------------------
         self.preconditions = [['none'], ['holding_obj']]    # [idle precondition], [place_in_backet_obj]                  
 
+        # Resources used by the actions above, actions sharing a resource cannot run in parallel
+        # ----------------------------------------------------------
+        self.resources = [[], ['right_arm']]
+
 
         # Likelihood matrix matrices
         # ----------------------------------------------------------
@@ -195,10 +215,6 @@ class MDPIsPlacedAt:
         # -----------------------------------------------------------
         self.D = np.array([[0.5], [0.5]])
 
-        # Initial guess about the states d, all equally possible, this is updated over time
-        # -----------------------------------------------------------
-        self.d = np.array([[0.5], [0.5]])
-
         # Preference about actions, idle is slightly preferred
         # -----------------------------------------------------------
         self.E = np.array([[1.01], [1]])
@@ -88,7 +88,7 @@ class MDPIsHolding:
         self.B[:, :, 1] = np.array([[1, 1],  # PickRight action
                                     [0, 0]])
         # Preconditions of the actions above
-        self.preconditions = [['none'], ['reachable'], ['none']]
+        self.preconditions = [['none'], ['reachable']]    # [idle precondition], [pick precondition]
 
         # Likelihood matrix matrices
         # ----------------------------------------------------------
@@ -135,9 +135,6 @@ class MDPIsPlacedOn:
         # Belief about initial state, D
         # -----------------------------------------------------------
         self.D = np.array([[0.5], [0.5]])
-        # Initial guess about the states d, all equally possible, this is updated over time
-        # -----------------------------------------------------------
-        self.d = np.array([[0.5], [0.5]])
         # Preference about actions, idle is slightly preferred
         # -----------------------------------------------------------
         self.E = np.array([[1.01], [1]])
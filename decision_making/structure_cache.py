@@ -0,0 +1,45 @@
+## Structure cache
+
+# This module contains the cache shared by the helpers which precompute something from the static structure of a list of agents, such as
+# the precondition index (precondition_index.py) and the resource table (plan_scheduler.py). An entry is found again for the same list
+# of agents, or for copies of them sharing the same template lists, without comparing the content of the templates.
+# The entries only keep the template lists they were built from (state names, preconditions, ...), never the agents themselves, so the
+# cache does not keep alive the beliefs, posteriors and workspaces of agents that are not used anymore.
+
+import threading
+from collections import OrderedDict
+
+
+class StructureCache(object):
+    def __init__(self, fields, maxsize=16):
+        # fields: attributes of the mdp of every agent the cached objects depend on
+        self.fields = tuple(fields)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # Key -> (template lists, object)
+        self._lock = threading.Lock()
+
+    def structure(self, agents):
+        # The template lists of every agent, missing attributes are None
+        return tuple(tuple(getattr(agent._mdp, name, None) for name in self.fields) for agent in agents)
+
+    def get(self, agents, build):
+        # Object built by build(agents), built again only if the structure of the agents changed since it was cached
+        structure = self.structure(agents)
+        key = tuple(tuple(id(value) for value in values) for values in structure)
+        with self._lock:
+            entry = self._entries.get(key)
+            # The template lists are kept in the entry, so their ids cannot be reused by other lists while it is cached
+            if entry is not None and all(a is b for values, cached in zip(structure, entry[0]) for a, b in zip(values, cached)):
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = build(agents)
+        with self._lock:
+            self._entries[key] = (structure, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,215 @@
+## Template loader
+
+# This module loads state/action templates from a declarative file (JSON, or YAML if PyYAML is installed) instead of a Python class
+# per factor. A file contains a list of factors:
+#
+#   {"factors": [{"state_name": "isAt",
+#                 "states": ["at_goal", "not_at_goal"],
+#                 "actions": [{"name": "idle", "transitions": "identity", "habit": 1.01},
+#                             {"name": "move_to", "transitions": {"to": "at_goal"}, "preconditions": ["none"]}]}]}
+#
+# The transitions of an action are "identity", {"to": state} for an action which sets the state, or a (states, states) matrix.
+# Preconditions default to ['none'], resources (names of the hardware an action uses, see plan_scheduler.py) to none and habits to 1. Optional fields of a factor: "likelihood" ("identity" or a matrix), "C" and "D"
+# (one value per state, no preference and a uniform belief by default), "policies" (V, all the actions by default) and "kappa_d".
+# The factors are validated and compiled into Template objects with normalised arrays, usable as any other template by AiAgent. The
+# compiled arrays are cached in a .npz file keyed by the hash of the content of the file, so that the next loads of the same content
+# skip the validation and the compilation.
+
+import hashlib
+import json
+import os
+import numpy as np
+
+CACHE_VERSION = 2           # Changing the compilation changes this version, so that old cache files are not used
+CACHE_DIR = '.template_cache'
+
+
+class TemplateSpecError(ValueError):
+    pass
+
+
+class Template(object):
+    # Template compiled from a declarative spec, with the same attributes as the template classes
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def _read(path):
+    with open(path) as f:
+        text = f.read()
+    if os.path.splitext(path)[1] in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('PyYAML is required to load the template file ' + path)
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def _matrix(value, n, where):
+    matrix = np.array(value, dtype=float)
+    if matrix.shape != (n, n):
+        raise TemplateSpecError('%s: expected a %dx%d matrix, got shape %s' % (where, n, n, matrix.shape))
+    if np.any(matrix < 0):
+        raise TemplateSpecError('%s: negative probabilities' % where)
+    return matrix
+
+
+def _vector(value, n, where):
+    vector = np.array(value, dtype=float)
+    if vector.shape != (n,):
+        raise TemplateSpecError('%s: expected %d values, got shape %s' % (where, n, vector.shape))
+    return vector
+
+
+def validate_factor(spec):
+    # Check one factor spec, raising TemplateSpecError with the location of the first problem found
+    name = spec.get('state_name') if isinstance(spec, dict) else None
+    if not isinstance(name, str):
+        raise TemplateSpecError('Factor without a state_name: %r' % (spec,))
+    states = spec.get('states')
+    if not isinstance(states, list) or len(states) < 1 or not all(isinstance(s, str) for s in states):
+        raise TemplateSpecError('%s: states must be a list of names' % name)
+    if len(set(states)) != len(states):
+        raise TemplateSpecError('%s: duplicated state names' % name)
+    actions = spec.get('actions')
+    if not isinstance(actions, list) or len(actions) < 1:
+        raise TemplateSpecError('%s: actions must be a non empty list' % name)
+    n = len(states)
+    for a, action in enumerate(actions):
+        where = '%s.actions[%d]' % (name, a)
+        if not isinstance(action, dict) or not isinstance(action.get('name'), str):
+            raise TemplateSpecError(where + ': action without a name')
+        transitions = action.get('transitions', 'identity')
+        if isinstance(transitions, dict):
+            if transitions.get('to') not in states:
+                raise TemplateSpecError('%s: unknown state %r' % (where, transitions.get('to')))
+        elif transitions != 'identity':
+            _matrix(transitions, n, where + '.transitions')
+        preconditions = action.get('preconditions', ['none'])
+        if not isinstance(preconditions, list) or not all(isinstance(p, str) for p in preconditions):
+            raise TemplateSpecError(where + ': preconditions must be a list of state names')
+        resources = action.get('resources', [])
+        if not isinstance(resources, list) or not all(isinstance(r, str) for r in resources):
+            raise TemplateSpecError(where + ': resources must be a list of names')
+        if not isinstance(action.get('habit', 1), (int, float)) or action.get('habit', 1) < 0:
+            raise TemplateSpecError(where + ': habit must be a non negative number')
+    likelihood = spec.get('likelihood', 'identity')
+    if likelihood != 'identity':
+        _matrix(likelihood, n, name + '.likelihood')
+    for field in ('C', 'D'):
+        if field in spec:
+            _vector(spec[field], n, '%s.%s' % (name, field))
+    policies = np.array(spec.get('policies', list(range(len(actions)))))
+    if policies.size == 0 or policies.ndim > 2 or not np.issubdtype(policies.dtype, np.integer) \
+            or np.any(policies < 0) or np.any(policies >= len(actions)):
+        raise TemplateSpecError('%s: policies must be action indexes' % name)
+
+
+def compile_factor(spec):
+    # Template with normalised arrays from a validated factor spec
+    states = spec['states']
+    actions = spec['actions']
+    n = len(states)
+    B = np.zeros((n, n, len(actions)))
+    for a, action in enumerate(actions):
+        transitions = action.get('transitions', 'identity')
+        if transitions == 'identity':
+            B[:, :, a] = np.eye(n)
+        elif isinstance(transitions, dict):
+            B[states.index(transitions['to']), :, a] = 1
+        else:
+            B[:, :, a] = np.array(transitions, dtype=float)
+    likelihood = spec.get('likelihood', 'identity')
+    A = np.eye(n) if likelihood == 'identity' else np.array(likelihood, dtype=float)
+    D = np.array(spec['D'], dtype=float) if 'D' in spec else np.ones(n)
+    return Template(state_name=spec['state_name'],
+                    state_names=list(states),
+                    action_names=[action['name'] for action in actions],
+                    V=np.array(spec.get('policies', list(range(len(actions)))), dtype=int),
+                    B=_normalize(B.reshape(n, -1)).reshape(B.shape),
+                    preconditions=[list(action.get('preconditions', ['none'])) for action in actions],
+                    resources=[list(action.get('resources', [])) for action in actions],
+                    A=_normalize(A),
+                    C=np.array(spec.get('C', np.zeros(n)), dtype=float).reshape(n, 1),
+                    D=_normalize(D.reshape(n, 1)),
+                    E=np.array([[float(action.get('habit', 1))] for action in actions]),
+                    kappa_d=spec.get('kappa_d', 1))
+
+
+def _normalize(matrix):
+    # Columns summing to one, columns without probability become uniform (as AiAgent.aip_norm)
+    sums = np.sum(matrix, axis=0)
+    return np.where(sums > 0, matrix/np.where(sums > 0, sums, 1), 1./matrix.shape[0])
+
+
+_ARRAYS = ('V', 'B', 'A', 'C', 'D', 'E')
+_FIELDS = ('state_name', 'state_names', 'action_names', 'preconditions', 'resources', 'kappa_d')
+
+
+def _save_cache(cache_file, templates):
+    # Every array field of all the templates is stored as one flat array, the shapes and the other fields in a json header
+    header = []
+    for template in templates:
+        fields = dict((field, getattr(template, field)) for field in _FIELDS)
+        fields['shapes'] = dict((field, getattr(template, field).shape) for field in _ARRAYS)
+        header.append(fields)
+    arrays = {'header': np.array(json.dumps(header))}
+    for field in _ARRAYS:
+        arrays[field] = np.concatenate([np.ravel(getattr(template, field)) for template in templates])
+    directory = os.path.dirname(cache_file)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_file = cache_file + '.%d.tmp.npz' % os.getpid()
+    np.savez(tmp_file, **arrays)
+    os.replace(tmp_file, cache_file)
+
+
+def _load_cache(cache_file):
+    with np.load(cache_file, allow_pickle=False) as data:
+        header = json.loads(str(data['header']))
+        arrays = dict((field, data[field]) for field in _ARRAYS)
+    offsets = dict((field, 0) for field in _ARRAYS)
+    templates = []
+    for fields in header:
+        shapes = fields.pop('shapes')
+        for field in _ARRAYS:
+            size = int(np.prod(shapes[field]))
+            fields[field] = arrays[field][offsets[field]:offsets[field] + size].reshape(shapes[field])
+            offsets[field] += size
+        templates.append(Template(**fields))
+    return templates
+
+
+def load_templates(path, cache_dir=None):
+    # Load the factors of a template file. Returns a dict state_name -> Template, in the order of the file.
+    # cache_dir: directory of the compiled cache, by default .template_cache next to the file. False disables the cache
+    spec = _read(path)
+    text = json.dumps(spec, sort_keys=True)
+    factors = spec['factors'] if isinstance(spec, dict) else spec
+    if not isinstance(factors, list) or len(factors) < 1:
+        raise TemplateSpecError('%s: expected a non empty list of factors' % path)
+
+    cache_file = None
+    if cache_dir is not False:
+        key = hashlib.sha1(('%d\n%s' % (CACHE_VERSION, text)).encode()).hexdigest()
+        cache_dir = cache_dir if cache_dir is not None else os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+        cache_file = os.path.join(cache_dir, key + '.npz')
+        if os.path.exists(cache_file):
+            try:
+                return dict((t.state_name, t) for t in _load_cache(cache_file))
+            except (OSError, ValueError, KeyError):
+                pass    # Unreadable cache file, compiled again
+
+    for factor in factors:
+        validate_factor(factor)
+    names = [factor['state_name'] for factor in factors]
+    if len(set(names)) != len(names):
+        raise TemplateSpecError('%s: duplicated state_name' % path)
+    templates = [compile_factor(factor) for factor in factors]
+    if cache_file is not None:
+        try:
+            _save_cache(cache_file, templates)
+        except OSError:
+            pass    # The cache is optional, for instance in a read-only installation
+    return dict((t.state_name, t) for t in templates)
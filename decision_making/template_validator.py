@@ -0,0 +1,112 @@
+## Template validator
+
+# This module checks the templates of a list of factors before they are used, so that a wrong template is reported when the agents are
+# built instead of showing up as wrong decisions at runtime. For every template it checks the shapes of A, B, C, D, E, V, the names,
+# the preconditions and the resources against the numbers of states and actions, that A and B are column-stochastic, and that V only
+# contains existing actions. For the list of factors it checks that every precondition is a state owned by some factor.
+# AgentBank validates its agents when it packs them, so the inference and the precondition checks can rely on consistent templates.
+
+import warnings
+import numpy as np
+
+STOCHASTIC_TOLERANCE = 1e-6     # Tolerance on the sum of the columns of A and B
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class TemplateWarning(UserWarning):
+    pass
+
+
+def _stochastic(matrix):
+    # True if every column of the matrix is a probability distribution
+    matrix = np.asarray(matrix, dtype=float)
+    return np.all(matrix >= 0) and np.allclose(np.sum(matrix, axis=0), 1, atol=STOCHASTIC_TOLERANCE)
+
+
+def template_problems(mdp):
+    # Errors and warnings of a single template (or of the mdp structure of an agent), as two lists of messages
+    errors = []
+    found = []
+    for name in ('state_names', 'action_names', 'A', 'B', 'V', 'E', 'preconditions'):
+        if not hasattr(mdp, name):
+            errors.append('missing ' + name)
+    if errors:
+        return errors, found
+    n_states = len(mdp.state_names)
+    n_actions = len(mdp.action_names)
+
+    # Transitions, any object with a shape such as a TransitionModel is only checked for its shape
+    B = mdp.B
+    if np.shape(B) != (n_states, n_states, n_actions):
+        errors.append('B has shape %s, expected %s for %d states and %d actions' % (np.shape(B), (n_states, n_states, n_actions),
+                                                                                   n_states, n_actions))
+    elif isinstance(B, np.ndarray):
+        for action in range(n_actions):
+            if not _stochastic(B[:, :, action]):
+                errors.append('B[:, :, %d] (%s) is not column-stochastic' % (action, mdp.action_names[action]))
+
+    # Likelihood
+    if np.shape(mdp.A) != (n_states, n_states):
+        errors.append('A has shape %s, expected %s' % (np.shape(mdp.A), (n_states, n_states)))
+    elif not _stochastic(mdp.A):
+        errors.append('A is not column-stochastic')
+
+    # Preferences, beliefs and habits
+    for name, size in (('C', n_states), ('D', n_states), ('E', n_actions)):
+        if hasattr(mdp, name) and np.size(getattr(mdp, name)) != size:
+            errors.append('%s has %d values, expected %d' % (name, np.size(getattr(mdp, name)), size))
+    if hasattr(mdp, 'd'):
+        found.append('defines d, which is not used (the initial belief is D)')
+
+    # Policies
+    V = np.asarray(mdp.V)
+    if V.ndim not in (1, 2) or V.size == 0:
+        errors.append('V must be a vector or a (policies, depth) matrix of actions')
+    elif not np.issubdtype(V.dtype, np.integer) or np.any(V < 0) or np.any(V >= n_actions):
+        errors.append('V contains actions outside 0..%d' % (n_actions - 1))
+
+    # Preconditions, one list of state names per action
+    if len(mdp.preconditions) != n_actions:
+        errors.append('%d precondition entries for %d actions' % (len(mdp.preconditions), n_actions))
+    for action, prec in enumerate(mdp.preconditions):
+        if isinstance(prec, str) or not all(isinstance(name, str) for name in prec):
+            errors.append('preconditions[%d] must be a list of state names' % action)
+
+    # Resources, optional, one list of resource names per action (see plan_scheduler.py)
+    resources = getattr(mdp, 'resources', None)
+    if resources is not None:
+        if len(resources) != n_actions:
+            errors.append('%d resource entries for %d actions' % (len(resources), n_actions))
+        for action, used in enumerate(resources):
+            if isinstance(used, str) or not all(isinstance(name, str) for name in used):
+                errors.append('resources[%d] must be a list of resource names' % action)
+    return errors, found
+
+
+def validate_templates(templates):
+    # Check a list of templates or agents. Raises TemplateError with all the errors, warns (TemplateWarning) and returns the warnings
+    mdps = [getattr(template, '_mdp', template) for template in templates]
+    errors = []
+    found = []
+    for i, mdp in enumerate(mdps):
+        label = '%s (factor %d)' % (getattr(mdp, 'state_name', type(mdp).__name__), i)
+        template_errors, template_warnings = template_problems(mdp)
+        errors.extend(label + ': ' + message for message in template_errors)
+        found.extend(label + ': ' + message for message in template_warnings)
+    if not errors:
+        # Every precondition must be a state of some factor, otherwise the action can never be selected
+        owned = set(name for mdp in mdps for name in mdp.state_names)
+        for i, mdp in enumerate(mdps):
+            for action, prec in enumerate(mdp.preconditions):
+                for name in prec:
+                    if name != 'none' and name not in owned:
+                        errors.append('%s (factor %d): precondition %r of %s is not a state of any factor'
+                                      % (getattr(mdp, 'state_name', type(mdp).__name__), i, name, mdp.action_names[action]))
+    if errors:
+        raise TemplateError('Invalid templates:\n  ' + '\n  '.join(errors))
+    for message in found:
+        warnings.warn(message, TemplateWarning, stacklevel=2)
+    return found
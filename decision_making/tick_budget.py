@@ -0,0 +1,45 @@
+## Tick budget
+
+# This module contains the budget for one tick of adapt_act_sel or par_act_sel. The inner loop of the selection functions runs inference
+# again every time preconditions are pushed; the budget bounds the number of these iterations and the wall-clock time of a tick.
+# When the budget runs out, the selection returns the outcome 'timeout' instead of looping further, together with its best decision so
+# far (the action found last with missing preconditions for adapt_act_sel, the plans found so far for par_act_sel). The budget also keeps
+# diagnostic counters about the last tick it was used for.
+
+import time
+
+DEFAULT_MAX_ITERATIONS = 100    # Used when no budget is given to the selection functions, so that a tick always terminates
+
+
+class TickBudget(object):
+    def __init__(self, max_iterations=DEFAULT_MAX_ITERATIONS, max_time=None):
+        self.max_iterations = max_iterations    # Maximum number of inner iterations per tick, None for no limit
+        self.max_time = max_time                # Maximum duration of a tick in seconds, None for no limit
+        self.start()
+
+    def start(self):
+        # Reset the counters at the beginning of a tick
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.
+        self.iterations = 0             # Inner iterations of the selection loop (inference passes over the agents)
+        self.preconditions_pushed = 0   # Preferences pushed on missing preconditions
+        self.actions_inhibited = 0      # Actions inhibited because of missing preconditions
+        self.pending_action = None      # Last action found with missing preconditions, the best partial result of adapt_act_sel
+        self.timed_out = False
+
+    def exhausted(self):
+        # True if no more iterations can be run in this tick
+        self.elapsed = time.perf_counter() - self.start_time
+        if self.max_iterations is not None and self.iterations >= self.max_iterations:
+            self.timed_out = True
+        elif self.max_time is not None and self.elapsed >= self.max_time:
+            self.timed_out = True
+        return self.timed_out
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.start_time
+
+    def stats(self):
+        # Diagnostic counters of the last tick
+        return {'iterations': self.iterations, 'preconditions_pushed': self.preconditions_pushed, 'actions_inhibited': self.actions_inhibited,
+                'pending_action': self.pending_action, 'elapsed': self.elapsed, 'timed_out': self.timed_out}
@@ -0,0 +1,134 @@
+## Tick driver
+
+# This module runs adapt_act_sel or par_act_sel in an asyncio event loop, fed by observation streams instead of a hardcoded list.
+# Every factor can have its own source (an async iterator or an asyncio.Queue) producing observations at its own rate. Observations are
+# coalesced: a tick uses the latest observation of every factor, the ones received in between are counted and dropped. Observations
+# older than stale_after seconds are dropped as well, and the factor is given 'null' until a new one arrives.
+# Ticks run at a target rate. A tick which ends after its deadline is counted as late, and the ticks missed meanwhile are skipped
+# instead of being run back to back, so that a driver that fell behind does not pile up work. Decisions are published to subscriber
+# queues; a full queue drops its oldest decision, or makes the driver wait for the subscriber if it asked for backpressure.
+
+import asyncio
+import time
+from decision_making.adaptive_action_selection import adapt_act_sel
+from decision_making.tick_budget import TickBudget
+
+
+class TickDriver(object):
+    def __init__(self, agent, selector=adapt_act_sel, rate=10., stale_after=None, offload=False, time_budget=False, **kwargs):
+        # agent: list of agents (or AgentBank) given to the selector, kwargs are passed to the selector at every tick
+        # offload: run the selector in the default executor of the loop, so that the sources keep being consumed during a tick
+        # time_budget: bound every tick with a TickBudget of one period, the selector returns 'timeout' when the period is over
+        self.agent = agent
+        self.selector = selector
+        self.period = 1./rate
+        self.stale_after = stale_after
+        self.offload = offload
+        self.time_budget = time_budget
+        self.kwargs = kwargs
+        self.n_factors = len(agent)
+        self.latest = ['null']*self.n_factors      # Last observation of every factor and its arrival time
+        self.received = [None]*self.n_factors
+        self._fresh = [False]*self.n_factors        # An observation arrived since the last tick
+        self._subscribers = []
+        self._running = False
+        self.ticks = 0
+        self.late_ticks = 0         # Ticks which ended after their deadline
+        self.skipped_ticks = 0      # Ticks not run because the driver was behind
+        self.coalesced = 0          # Observations replaced by a newer one before a tick used them
+        self.stale = 0              # Observations dropped because they were older than stale_after
+        self.max_lateness = 0.
+
+    def update(self, factor, obs):
+        # New observation of a factor, used by the next tick
+        if self._fresh[factor]:
+            self.coalesced += 1
+        self.latest[factor] = obs
+        self.received[factor] = time.monotonic()
+        self._fresh[factor] = True
+
+    async def consume(self, factor, source):
+        # Feed a factor from an async iterator or an asyncio.Queue until the source ends or the driver stops
+        if isinstance(source, asyncio.Queue):
+            while True:
+                self.update(factor, await source.get())
+                source.task_done()
+        async for obs in source:
+            self.update(factor, obs)
+
+    def subscribe(self, maxsize=1, backpressure=False):
+        # Queue receiving the decisions of the ticks. With backpressure the driver waits when the queue is full, otherwise the oldest
+        # decision in the queue is dropped
+        queue = asyncio.Queue(maxsize)
+        self._subscribers.append((queue, backpressure))
+        return queue
+
+    def observations(self):
+        # Observations for the next tick, the stale ones are replaced by 'null'
+        now = time.monotonic()
+        obs = list(self.latest)
+        for f in range(self.n_factors):
+            if self.stale_after is not None and obs[f] != 'null' and now - self.received[f] > self.stale_after:
+                self.latest[f] = obs[f] = 'null'
+                self.stale += 1
+        self._fresh = [False]*self.n_factors
+        return obs
+
+    def tick(self, obs):
+        # One call of the selector
+        kwargs = dict(self.kwargs)
+        if self.time_budget:
+            kwargs['budget'] = TickBudget(max_time=self.period)
+        return self.selector(self.agent, obs, **kwargs)
+
+    async def _publish(self, decision):
+        for queue, backpressure in self._subscribers:
+            if backpressure:
+                await queue.put(decision)
+                continue
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(decision)
+
+    async def run(self, sources=None, n_ticks=None):
+        # Run ticks at the target rate until stop() is called or n_ticks ticks are done
+        # sources: optional dict factor -> source, consumed by tasks running as long as the driver
+        # get_running_loop needs Python 3.7, inside a coroutine get_event_loop returns the same loop
+        loop = asyncio.get_running_loop() if hasattr(asyncio, 'get_running_loop') else asyncio.get_event_loop()
+        tasks = [asyncio.ensure_future(self.consume(f, source)) for f, source in (sources or {}).items()]
+        self._running = True
+        deadline = loop.time()
+        try:
+            while self._running and (n_ticks is None or self.ticks < n_ticks):
+                deadline += self.period
+                obs = self.observations()
+                start = loop.time()
+                if self.offload:
+                    result = await loop.run_in_executor(None, self.tick, obs)
+                else:
+                    result = self.tick(obs)
+                self.ticks += 1
+                end = loop.time()
+                lateness = end - deadline
+                await self._publish({'tick': self.ticks, 'obs': obs, 'result': result, 'duration': end - start,
+                                     'lateness': max(lateness, 0.)})
+                if lateness > 0:
+                    # Behind schedule, the missed ticks are skipped and the next deadline is one period from now
+                    self.late_ticks += 1
+                    self.max_lateness = max(self.max_lateness, lateness)
+                    missed = int(lateness // self.period)
+                    self.skipped_ticks += missed
+                    deadline += missed*self.period
+                await asyncio.sleep(max(deadline - loop.time(), 0.))
+        finally:
+            self._running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        return {'ticks': self.ticks, 'late_ticks': self.late_ticks, 'skipped_ticks': self.skipped_ticks, 'coalesced': self.coalesced,
+                'stale': self.stale, 'max_lateness': self.max_lateness}
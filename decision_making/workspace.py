@@ -0,0 +1,60 @@
+## Workspace
+
+# This module contains the preallocated buffers used by AiAgent(mdp, workspace=True). The buffers are allocated at the first tick and
+# reused by the following ticks through numpy out= operations, so that a control loop running the inference at a high rate does not
+# allocate (and collect) the same arrays at every tick. A buffer is allocated again only if its shape changes.
+# measure_allocations reports the memory allocated during a call, traced with tracemalloc, to check the allocations of a tick.
+
+import tracemalloc
+import numpy as np
+
+
+class Workspace(object):
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0        # Number of buffers allocated
+        self.allocated_bytes = 0    # Bytes of the buffers allocated
+
+    def get(self, name, shape, dtype=float):
+        # Buffer with the given name, shape and type. Its content is the one left by the previous tick
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+            self.allocated_bytes += buffer.nbytes
+        return buffer
+
+    def full(self, name, shape, value, dtype=float):
+        # Buffer filled with value
+        buffer = self.get(name, shape, dtype)
+        buffer.fill(value)
+        return buffer
+
+    def nbytes(self):
+        # Bytes currently held by the buffers
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    def stats(self):
+        return {'buffers': len(self.buffers), 'bytes': self.nbytes(), 'allocations': self.allocations,
+                'allocated_bytes': self.allocated_bytes}
+
+
+def measure_allocations(function, *args, **kwargs):
+    # Call function and return its result together with the memory allocated during the call: peak_bytes is the maximum memory
+    # allocated at any time of the call, retained_bytes the memory still allocated after it
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        # reset_peak needs Python 3.9. Before, the peak is exact when tracing starts here, and also counts the allocations made before
+        # the call when the caller was already tracing
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    return result, {'peak_bytes': peak - before, 'retained_bytes': current - before}
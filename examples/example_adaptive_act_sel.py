@@ -3,8 +3,13 @@
 # Simple example to create an AI agent which selects actions to satisfy a task
 
 import numpy as np
+import logging
+import sys
 from decision_making import ai_agent, state_action_templates, adaptive_action_selection, parallel_action_selection
 
+# Show the messages of the action selection
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
+
 ## Initialization
 # ----------------- 
 # Define the required mdp structures from the templates
@@ -3,7 +3,13 @@
 # Simple example to create an AI agent for pick and place
 
 import numpy as np
+import logging
+import sys
 from decision_making import ai_agent, state_action_templates_panda, adaptive_action_selection
+
+# Show the messages of the action selection
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
+
 ## Initialization
 # ----------------- 
 mdp_isAtPlaceLoc = state_action_templates_panda.MDPIsAtPlaceLoc() 
@@ -3,9 +3,14 @@
 # Simple example to create an AI agent which selects actions to satisfy task needs
 
 import numpy as np
+import logging
+import sys
 from decision_making import ai_agent, state_act_point_robot, parallel_action_selection
 import time
 
+# Show the messages of the action selection
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
+
 ## Initialization
 # ----------------- 
 # Define the required mdp structures from the templates
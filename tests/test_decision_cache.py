@@ -0,0 +1,63 @@
+## Decision cache tests
+
+# A selection through DecisionCache must make the same decisions as the selection without cache over the pick and place sequence of
+# examples/example_panda_pick_place.py, run twice so that the second run hits the entries of the first one.
+
+import numpy as np
+import pytest
+from decision_making import ai_agent, state_action_templates_panda
+from decision_making.adaptive_action_selection import adapt_act_sel
+from decision_making.parallel_action_selection import par_act_sel
+from decision_making.agent_bank import AgentBank
+from decision_making.decision_cache import DecisionCache
+
+PICK_PLACE_OBS = [[1, 1, 1, 1]]*3 + [[1, 1, 0, 1]]*2 + [[1, 0, 0, 1]]*3 + [[1, 1, 1, 1]]*2 + [[1, 1, 0, 1]]*2 + [[1, 0, 0, 1]]*2 + \
+    [[0, 0, 0, 1]] + [[0, 0, 0, 0]]*5 + [[1, 1, 1, 1]]*3 + [[1, 1, 0, 1]]*2 + [[1, 0, 0, 1]]*3 + [[0, 0, 0, 1]]*2 + [[0, 0, 0, 0]]*2
+
+
+def pick_place_agents(container=list):
+    # Agents of the pick and place example, [isAtPlaceLoc, isHolding, isReachable, isPlacedOn]
+    agents = container([ai_agent.AiAgent(state_action_templates_panda.MDPIsAtPlaceLoc()),
+                        ai_agent.AiAgent(state_action_templates_panda.MDPIsHolding()),
+                        ai_agent.AiAgent(state_action_templates_panda.MDPIsReachable()),
+                        ai_agent.AiAgent(state_action_templates_panda.MDPIsPlacedOn())])
+    agents[3].set_preferences(np.array([[1.], [0.]]))
+    return agents
+
+
+def run(select, agents):
+    # Decisions and beliefs after every tick of the sequence
+    decisions, beliefs = [], []
+    for obs in PICK_PLACE_OBS*2:
+        decisions.append(select(agents, list(obs)))
+        beliefs.append(np.concatenate([agent._mdp.D[:, 0] for agent in agents]))
+    return decisions, np.array(beliefs)
+
+
+@pytest.mark.parametrize('selector', [adapt_act_sel, par_act_sel])
+@pytest.mark.parametrize('container', [list, AgentBank])
+@pytest.mark.parametrize('options', [{}, {'exact': False, 'decimals': 1}])
+def test_cached_decisions_match_uncached(selector, container, options):
+    decisions, beliefs = run(selector, pick_place_agents(container))
+    cache = DecisionCache(selector=selector, **options)
+    cached_decisions, cached_beliefs = run(cache.select, pick_place_agents(container))
+    assert cache.hits > 0
+    assert cached_decisions == decisions
+    np.testing.assert_allclose(cached_beliefs, beliefs, rtol=0, atol=1e-9)
+
+
+def test_exact_cache_keeps_the_belief_trajectory():
+    decisions, beliefs = run(adapt_act_sel, pick_place_agents())
+    cached_decisions, cached_beliefs = run(DecisionCache().select, pick_place_agents())
+    assert cached_decisions == decisions
+    assert np.array_equal(cached_beliefs, beliefs)
+
+
+def test_belief_keeps_moving_on_hits():
+    # With a coarse bucket the same key is hit while D moves towards the observed state, D must still reach it
+    agents = pick_place_agents()
+    cache = DecisionCache(exact=False, decimals=1)
+    for obs in [[1, 1, 1, 1]]*3 + [[1, 1, 0, 1]]*20:
+        cache.select(agents, obs)
+    assert cache.hits > 0
+    assert agents[2]._mdp.D[0, 0] == pytest.approx(1.)
@@ -0,0 +1,67 @@
+## Inference equivalence tests
+
+# The batched, workspace and sparse inferences must give the same posteriors, free energies and beliefs as the reference loop
+# (infer_states_loop and infer_policies_loop) over a sequence of observations, for the shipped templates and for policies of depth 3.
+
+import numpy as np
+import pytest
+from decision_making import ai_agent, state_action_templates, state_action_templates_panda, state_act_point_robot
+from decision_making.agent_bank import AgentBank
+from decision_making.policy_tree import expand_policies
+
+PATHS = {'batched': {}, 'workspace': {'workspace': True}, 'sparse': {'sparse': True}}
+
+
+def deep_holding():
+    # isHolding with every sequence of 3 actions as policies
+    mdp = state_action_templates.MDPIsHolding()
+    mdp.V = expand_policies(np.shape(mdp.B)[2], 3)
+    return mdp
+
+
+TEMPLATES = [state_action_templates_panda.MDPIsAtPlaceLoc, state_action_templates_panda.MDPIsHolding,
+             state_action_templates_panda.MDPIsPlacedOn, state_act_point_robot.MDPIsAt, state_act_point_robot.MDPIsLocFree,
+             state_action_templates.MDPIsReachable, deep_holding]
+
+
+def observations(agent):
+    # Every state observed for a few ticks, then back to the first one
+    return [s for s in range(agent.n_states) for _ in range(3)] + [0]*3
+
+
+def assert_same_inference(agent, reference):
+    np.testing.assert_allclose(agent.post_x, reference.post_x, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(agent.F, reference.F, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(agent.G, reference.G, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(agent.post_pi, reference.post_pi, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(agent._mdp.D, reference._mdp.D, rtol=0, atol=1e-12)
+    assert agent.u == reference.u
+
+
+@pytest.mark.parametrize('template', TEMPLATES)
+@pytest.mark.parametrize('path', sorted(PATHS))
+def test_paths_match_loop(template, path):
+    reference = ai_agent.AiAgent(template(), batched=False)
+    agent = ai_agent.AiAgent(template(), **PATHS[path])
+    reference._mdp.C[-1] = agent._mdp.C[-1] = 1.     # Prefer the last state, so that some policies are better than others
+    for obs in observations(reference):
+        reference.infer(obs)
+        agent.infer(obs)
+        assert_same_inference(agent, reference)
+
+
+def test_bank_matches_loop():
+    # The factors of a bank are checked together, so they come from the same set of templates
+    templates = [state_action_templates_panda.MDPIsAtPlaceLoc, state_action_templates_panda.MDPIsHolding,
+                 state_action_templates_panda.MDPIsReachable, state_action_templates_panda.MDPIsPlacedOn]
+    references = [ai_agent.AiAgent(template(), batched=False) for template in templates]
+    bank = AgentBank([ai_agent.AiAgent(template()) for template in templates])
+    for agent, reference in zip(bank, references):
+        reference._mdp.C[-1] = agent._mdp.C[-1] = 1.
+    for tick in range(12):
+        obs = [(tick//3) % agent.n_states for agent in references]
+        for reference, o in zip(references, obs):
+            reference.infer(o)
+        bank.infer(obs)
+        for agent, reference in zip(bank, references):
+            assert_same_inference(agent, reference)
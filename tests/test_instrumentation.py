@@ -0,0 +1,50 @@
+## Tracer tests
+
+import json
+import numpy as np
+from decision_making import ai_agent, state_act_point_robot
+from decision_making.adaptive_action_selection import adapt_act_sel
+from decision_making.parallel_action_selection import par_act_sel
+from decision_making.instrumentation import Tracer
+
+OBS = ['null', 1, 0, 0]     # Point robot, block not at the goal, location free, close to the block
+
+
+def point_robot_agents(**options):
+    agents = [ai_agent.AiAgent(m, **options) for m in (state_act_point_robot.MDPIsAt(), state_act_point_robot.MDPIsBlockAt(),
+                                                       state_act_point_robot.MDPIsLocFree(), state_act_point_robot.MDPIsCloseTo())]
+    agents[1].set_preferences(np.array([[1.], [0.]]))
+    return agents
+
+
+def test_lazy_plans_are_left_to_the_caller(tmp_path):
+    tracer = Tracer()
+    outcome, plans = par_act_sel(point_robot_agents(), OBS, tracer=tracer, lazy=True)
+    record = tracer.last()
+    assert record['lazy'] and record['result'] is None
+    tracer.dump(str(tmp_path / 'trace.jsonl'))
+    assert json.loads((tmp_path / 'trace.jsonl').read_text())['result'] is None
+    assert list(plans) == par_act_sel(point_robot_agents(), OBS)[1]
+
+
+def test_plans_are_recorded():
+    tracer = Tracer()
+    outcome, plans = par_act_sel(point_robot_agents(), OBS, tracer=tracer)
+    assert not tracer.last()['lazy'] and tracer.last()['result'] == plans
+
+
+def run_ticks(agents, n_ticks=30):
+    # Inference calls of every factor over n_ticks ticks with the same observations
+    tracer = Tracer()
+    for tick in range(n_ticks):
+        adapt_act_sel(agents, OBS, tracer=tracer)
+    return np.sum([record['inference_calls'] for record in tracer.records], axis=0)
+
+
+def test_skipped_inferences_are_not_counted():
+    # With a tolerance, the factors whose belief converged reuse their last inference
+    agents = point_robot_agents(tolerance=1e-6)
+    calls = run_ticks(agents)
+    skipped = [agent.skipped_inferences for agent in agents]
+    assert sum(skipped) > 0
+    np.testing.assert_array_equal(run_ticks(point_robot_agents()) - calls, skipped)
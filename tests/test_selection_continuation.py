@@ -0,0 +1,52 @@
+## Anytime selection tests
+
+# A factor prefers opening a door, which needs a key that no action can get, over climbing through a window. An unbounded tick inhibits
+# the door and selects the window; with a budget of one iteration per tick, only the continuation carries the inhibited door to the
+# next tick.
+
+import numpy as np
+from decision_making.ai_agent import AiAgent
+from decision_making.template_loader import compile_factor
+from decision_making.adaptive_action_selection import adapt_act_sel
+from decision_making.selection_continuation import SelectionContinuation
+from decision_making.tick_budget import TickBudget
+from decision_making.fleet import Fleet
+
+OBS = [1, 1]    # Not through, no key
+
+
+def door_agents():
+    through = compile_factor({'state_name': 'isThrough', 'states': ['through', 'not_through'], 'actions': [
+        {'name': 'idle', 'transitions': 'identity', 'habit': 1.01},
+        {'name': 'open_door', 'transitions': {'to': 'through'}, 'preconditions': ['has_key'], 'habit': 1.005},
+        {'name': 'climb_window', 'transitions': {'to': 'through'}}]})
+    key = compile_factor({'state_name': 'hasKey', 'states': ['has_key', 'no_key'], 'actions': [
+        {'name': 'idle', 'transitions': 'identity'}]})
+    agents = [AiAgent(through), AiAgent(key)]
+    agents[0].set_preferences(np.array([[1.], [0.]]))
+    return agents
+
+
+def test_unbounded_tick_selects_the_alternative():
+    assert adapt_act_sel(door_agents(), OBS) == ('running', 'climb_window')
+
+
+def test_timeout_returns_the_pending_action():
+    agents = door_agents()
+    for tick in range(5):
+        assert adapt_act_sel(agents, OBS, budget=TickBudget(max_iterations=1)) == ('timeout', 'open_door')
+
+
+def test_continuation_saves_ticks():
+    agents = door_agents()
+    continuation = SelectionContinuation()
+    assert adapt_act_sel(agents, OBS, budget=TickBudget(max_iterations=1), continuation=continuation) == ('timeout', 'open_door')
+    assert continuation.pending_action == 'open_door'
+    assert adapt_act_sel(agents, OBS, budget=TickBudget(max_iterations=1), continuation=continuation) == ('running', 'climb_window')
+    assert continuation.stats()['resumed_ticks'] == 1
+
+
+def test_fleet_timeout_returns_the_pending_action():
+    fleet = Fleet(door_agents(), n_robots=2)
+    assert fleet.tick([OBS, OBS], max_iterations=1) == [('timeout', 'open_door')]*2
+    assert fleet.tick([OBS, OBS]) == [('running', 'climb_window')]*2
@@ -0,0 +1,27 @@
+## Template loader tests
+
+import json
+import numpy as np
+import pytest
+from decision_making.template_loader import load_templates, TemplateSpecError
+
+TASK_TEMPLATES = 'decision_making/templates/task_templates.json'
+
+
+@pytest.mark.parametrize('content', [{'factors': []}, []])
+def test_empty_factor_list_is_rejected(tmp_path, content):
+    path = tmp_path / 'empty.json'
+    path.write_text(json.dumps(content))
+    with pytest.raises(TemplateSpecError):
+        load_templates(str(path), cache_dir=str(tmp_path / 'cache'))
+
+
+def test_cached_templates_match_compiled(tmp_path):
+    compiled = load_templates(TASK_TEMPLATES, cache_dir=False)
+    load_templates(TASK_TEMPLATES, cache_dir=str(tmp_path))
+    cached = load_templates(TASK_TEMPLATES, cache_dir=str(tmp_path))
+    assert list(cached) == list(compiled)
+    for name, template in compiled.items():
+        for field in ('V', 'B', 'A', 'C', 'D', 'E'):
+            assert np.array_equal(getattr(cached[name], field), getattr(template, field))
+        assert cached[name].preconditions == template.preconditions
@@ -0,0 +1,49 @@
+## Multi-sweep and warm-started inference tests
+
+import itertools
+import numpy as np
+import pytest
+from decision_making import ai_agent, state_action_templates
+
+
+class DeepFactor(object):
+    # 16 states observed with noise, action 0 is idle and action a sets the state a-1, every policy of depth 3 over the 4 actions
+    def __init__(self):
+        n = 16
+        self.state_name = 'deep'
+        self.state_names = ['s%d' % s for s in range(n)]
+        self.action_names = ['idle', 'a1', 'a2', 'a3']
+        self.V = np.array(list(itertools.product(range(4), repeat=3)))
+        self.B = np.zeros((n, n, 4))
+        self.B[:, :, 0] = np.eye(n)
+        for a in range(1, 4):
+            self.B[a - 1, :, a] = 1
+        self.preconditions = [['none']]*4
+        self.A = 0.8*np.eye(n) + 0.2/n
+        self.C = np.zeros((n, 1))
+        self.C[2] = 1
+        self.D = np.ones((n, 1))/n
+        self.E = np.array([[1.01], [1.], [1.], [1.]])
+        self.kappa_d = 1
+
+
+@pytest.mark.parametrize('options', [{'n_iterations': 0}, {'n_iterations': -1}, {'free_energy_tolerance': 0},
+                                     {'free_energy_tolerance': -1e-4}])
+def test_invalid_sweep_options(options):
+    with pytest.raises(ValueError):
+        ai_agent.AiAgent(state_action_templates.MDPIsHolding(), **options)
+
+
+@pytest.mark.parametrize('workspace', [False, True])
+def test_warm_start_matches_cold_start(workspace):
+    # The warm start saves sweeps once the belief has converged after a change of observation
+    cold = ai_agent.AiAgent(DeepFactor(), n_iterations=20, free_energy_tolerance=1e-6, workspace=workspace)
+    warm = ai_agent.AiAgent(DeepFactor(), n_iterations=20, free_energy_tolerance=1e-6, workspace=workspace, warm_start=True)
+    cold_sweeps = warm_sweeps = 0
+    for obs in [15]*30 + [3]*30:
+        assert cold.infer(obs) == warm.infer(obs)
+        cold_sweeps += cold.state_iterations
+        warm_sweeps += warm.state_iterations
+        np.testing.assert_allclose(warm.F, cold.F, atol=1e-4)
+        np.testing.assert_allclose(warm._mdp.D, cold._mdp.D, atol=1e-6)
+    assert warm_sweeps < cold_sweeps